@@ -0,0 +1,75 @@
+import timeit
+
+from units_python.function_hook import Hook, Checkpoint, ProbabilitySampler
+from units_python.profiling import Profiler
+
+
+class Plain:
+    def work(self, a, b=1, *, c=2):
+        return a + b + c
+
+
+hook = Hook()
+
+
+@hook.hook
+class Hooked:
+    def work(self, a, b=1, *, c=2):
+        return a + b + c
+
+
+profiled_hook = Hook()
+
+
+@profiled_hook.hook
+class Profiled:
+    def work(self, a, b=1, *, c=2):
+        return a + b + c
+
+
+sampled_hook = Hook()
+
+
+@sampled_hook.hook
+class Sampled:
+    def work(self, a, b=1, *, c=2):
+        return a + b + c
+
+
+class Noop(Checkpoint):
+    def enter(self, args, kwargs):
+        pass
+
+    def exit(self, result):
+        pass
+
+    def exception(self, exc: Exception):
+        pass
+
+
+def bench(label: str, fn, number: int = 1 << 20):
+    cost = min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e9
+    print(f"{label:<32}{cost:>8.1f} ns/call")
+    return cost
+
+
+if __name__ == "__main__":
+    plain = Plain()
+    hooked = Hooked()
+
+    base = bench("unhooked", lambda: plain.work(1, c=3))
+    empty = bench("hooked, no checkpoint", lambda: hooked.work(1, c=3))
+    hook.add_checkpoint(lambda fn: Noop())
+    noop = bench("hooked, 1 noop checkpoint", lambda: hooked.work(1, c=3))
+
+    sampled_hook.add_checkpoint(lambda fn: Noop(), sampler=ProbabilitySampler(0))
+    sampled = Sampled()
+    skipped = bench("hooked, 1 unsampled checkpoint", lambda: sampled.work(1, c=3))
+
+    Profiler().install(profiled_hook)
+    profiled = Profiled()
+    recorded = bench("hooked, Profiler", lambda: profiled.work(1, c=3))
+
+    print(f"wrapper overhead: {empty - base:.1f} ns (no checkpoint), {noop - base:.1f} ns (1 checkpoint)")
+    print(f"unsampled call: {skipped - empty:.1f} ns")
+    print(f"profiler recording: {recorded - empty:.1f} ns")
@@ -0,0 +1,45 @@
+def test():
+    import asyncio
+    import threading
+
+    import trio
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.qt_asyncio import QtAsyncio, QtAsyncioThread
+    from units_python.trio_qt import TrioQtThread, wait_future
+
+    app = QApplication.instance() or QApplication()
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop)
+    result = {}
+
+    async def _asyncio_work(x: int):
+        await asyncio.sleep(.01)
+        return x * 2, threading.get_ident()
+
+    async def _trio_work(x: int, other: QtAsyncioThread):
+        await trio.sleep(.01)
+        # hand off from the trio thread to the asyncio thread
+        doubled, _ = await wait_future(other.submit(_asyncio_work(x)))
+        return doubled + 1, threading.get_ident()
+
+    async def _main():
+        with QtAsyncioThread() as asyncio_thread, TrioQtThread() as trio_thread:
+            futures = [asyncio_thread.submit(_asyncio_work(i)) for i in range(8)]
+            result["asyncio"] = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+            result["trio"] = await asyncio.wrap_future(trio_thread.submit(_trio_work, 5, asyncio_thread))
+            blocked = asyncio_thread.submit(asyncio.sleep(10))
+            await asyncio.sleep(.01)
+            blocked.cancel()
+            result["cancelled"] = blocked.cancelled()
+        app.exit(0)
+
+    qt_asyncio.create_task(_main())
+    app.exec_()
+
+    main = threading.get_ident()
+    assert [value for value, _ in result["asyncio"]] == [i * 2 for i in range(8)]
+    assert len({thread for _, thread in result["asyncio"]}) == 1
+    assert result["asyncio"][0][1] != main
+    assert result["trio"][0] == 11 and result["trio"][1] not in (main, result["asyncio"][0][1])
+    assert result["cancelled"]
@@ -1,4 +1,5 @@
 import types
+import typing
 
 from units_python.function_hook import Hook, Checkpoint
 
@@ -39,8 +40,565 @@ class Cp(Checkpoint):
 hook.add_checkpoint(lambda fn: Cp(fn))
 
 
+class Recorder(Checkpoint):
+    """appends (tag, "enter"[, args, kwargs]), (tag, "exit", result) and (tag, "exception", type) to events"""
+
+    def __init__(self, events: list, tag: typing.Any, arguments: bool = False):
+        self.events = events
+        self.tag = tag
+        self.arguments = arguments
+
+    @classmethod
+    def factory(cls, events: list, arguments: bool = False):
+        """tags the events with the hooked function's name"""
+        return lambda fn: cls(events, fn.__name__, arguments)
+
+    def enter(self, args, kwargs):
+        self.events.append((self.tag, "enter", args, kwargs) if self.arguments else (self.tag, "enter"))
+
+    def exit(self, result):
+        self.events.append((self.tag, "exit", result))
+
+    def exception(self, exc: BaseException):
+        self.events.append((self.tag, "exception", type(exc)))
+
+
+def _entered(events: list):
+    return [event[0] for event in events if event[1] == "enter"]
+
+
 def test():
     d = Demo()
     d.a(0, 1., 2, d=3, e=4)
     d.b(0, 1., 2, d=3, e=4)
     d.c(0, 1., 2, d=3, e=4)
+
+
+def test_checkpoint_cache():
+    from units_python.function_hook import CheckpointScope
+
+    created = []
+    events = []
+
+    def counter(scope: str):
+        def factory(fn: types.FunctionType):
+            created.append((fn.__name__, scope))
+            return Recorder(events, scope)
+
+        return factory
+
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def work(self, x):
+            return x
+
+    h.add_checkpoint(counter("function"))
+    s = Service()
+    for i in range(3):
+        s.work(i)
+    assert created == [("work", "function")]
+    assert _entered(events) == ["function"] * 3
+
+    created.clear()
+    events.clear()
+    h.add_checkpoint(counter("call"), CheckpointScope.CALL)
+    for i in range(3):
+        s.work(i)
+    assert created == [("work", "call")] * 3
+    assert _entered(events) == ["function", "call"] * 3
+
+    # enter follows registration order, whatever the scope
+    events.clear()
+    h.add_checkpoint(counter("function-after"))
+    s.work(0)
+    assert _entered(events) == ["function", "call", "function-after"]
+
+
+def test_arguments_and_result():
+    import inspect
+
+    events = []
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def work(self, a, /, b=2, *c, d=4, **e):
+            if a is None:
+                raise ValueError(a)
+            return a, b, c, d, e
+
+    s = Service()
+    assert s.work(1) == (1, 2, (), 4, {})
+
+    h.add_checkpoint(Recorder.factory(events, arguments=True))
+    assert s.work(1, 3, 5, f=6) == (1, 3, (5,), 4, {"f": 6})
+    bound = inspect.signature(Service.work).bind(s, 1, 3, 5, f=6)
+    bound.apply_defaults()
+    assert events == [("work", "enter", bound.args, bound.kwargs), ("work", "exit", (1, 3, (5,), 4, {"f": 6}))]
+
+    events.clear()
+    try:
+        s.work(None)
+    except ValueError:
+        pass
+    else:
+        assert False
+    assert events == [("work", "enter", (s, None, 2), {"d": 4}), ("work", "exception", ValueError)]
+
+
+def test_coroutine_and_generators():
+    import asyncio
+
+    events = []
+    h = Hook()
+
+    @h.hook
+    class Service:
+        async def fetch(self, x):
+            await asyncio.sleep(0)
+            events.append(("fetch", "body"))
+            return x * 2
+
+        async def stream(self, n):
+            for i in range(n):
+                sent = yield i
+                events.append(("stream", "sent", sent))
+
+        def count(self, n):
+            for i in range(n):
+                yield i
+            return n
+
+    h.add_checkpoint(Recorder.factory(events))
+    s = Service()
+
+    coro = s.fetch(2)
+    assert events == []
+    assert asyncio.run(coro) == 4
+    assert events == [("fetch", "enter"), ("fetch", "body"), ("fetch", "exit", 4)]
+
+    events.clear()
+
+    async def consume():
+        gen = s.stream(3)
+        values = [await gen.__anext__()]
+        values.append(await gen.asend("a"))
+        await gen.aclose()
+        return values
+
+    assert asyncio.run(consume()) == [0, 1]
+    assert events == [("stream", "enter"), ("stream", "sent", "a"), ("stream", "exit", None)]
+
+    events.clear()
+    gen = s.count(2)
+    assert events == []
+    assert list(gen) == [0, 1]
+    assert events == [("count", "enter"), ("count", "exit", 2)]
+
+    events.clear()
+
+    async def cancel():
+        task = asyncio.create_task(s.fetch(1))
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(cancel())
+    assert events == [("fetch", "enter"), ("fetch", "exception", asyncio.CancelledError)]
+
+
+def test_buffered_checkpoint():
+    from units_python.function_hook import BufferedCheckpoint, CheckpointDispatcher, DispatchPolicy
+
+    events = []
+    dispatcher = CheckpointDispatcher(capacity=4, policy=DispatchPolicy.DROP_NEWEST)
+    h = Hook()
+    h.add_checkpoint(lambda fn: BufferedCheckpoint(Recorder(events, "work"), dispatcher))
+
+    @h.hook
+    class Service:
+        def work(self, x):
+            return x
+
+    s = Service()
+    for i in range(3):
+        s.work(i)
+    assert events == []
+    assert (dispatcher.pending, dispatcher.dropped) == (4, 2)
+    assert dispatcher.flush() == 4
+    assert events == [("work", "enter"), ("work", "exit", 0), ("work", "enter"), ("work", "exit", 1)]
+
+    events.clear()
+    dispatcher = CheckpointDispatcher(capacity=2, policy=DispatchPolicy.DROP_OLDEST)
+    checkpoint = BufferedCheckpoint(Recorder(events, "work"), dispatcher)
+    for i in range(3):
+        checkpoint.exit(i)
+    dispatcher.flush()
+    assert events == [("work", "exit", 1), ("work", "exit", 2)]
+    assert (dispatcher.submitted, dispatcher.dropped, dispatcher.dispatched) == (3, 1, 2)
+
+    events.clear()
+    dispatcher = CheckpointDispatcher(capacity=2, policy=DispatchPolicy.BLOCK, batch_size=1, interval=.01)
+    checkpoint = BufferedCheckpoint(Recorder(events, "work"), dispatcher)
+    dispatcher.start()
+    for i in range(16):
+        checkpoint.exit(i)
+    dispatcher.stop()
+    assert events == [("work", "exit", i) for i in range(16)]
+    assert dispatcher.dropped == 0
+
+    # producers on many threads never lose a count
+    import threading
+
+    dispatcher = CheckpointDispatcher(capacity=64, policy=DispatchPolicy.DROP_NEWEST)
+    checkpoint = BufferedCheckpoint(Recorder([], "work"), dispatcher)
+
+    def _produce():
+        for i in range(2000):
+            checkpoint.exit(i)
+            if i % 16 == 0:
+                dispatcher.flush()
+
+    threads = [threading.Thread(target=_produce) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.flush()
+    assert dispatcher.submitted == 8000 and dispatcher.dropped + dispatcher.dispatched == 8000
+
+    # drained by a task on the hooked code's own loop, a full buffer is flushed inline instead of blocking
+    import asyncio
+
+    events.clear()
+    dispatcher = CheckpointDispatcher(capacity=2, policy=DispatchPolicy.BLOCK, interval=.01)
+    h = Hook()
+    h.add_checkpoint(lambda fn: BufferedCheckpoint(Recorder(events, "work"), dispatcher))
+    h.hook(Service)
+
+    async def main():
+        drain = asyncio.create_task(dispatcher.run())
+        await asyncio.sleep(0)
+        for i in range(4):
+            s.work(i)
+        dispatcher.stop()
+        await drain
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert [event for event in events if event[1] == "exit"] == [("work", "exit", i) for i in range(4)]
+    assert dispatcher.dropped == 0
+
+
+def test_sampler():
+    from units_python.function_hook import CheckpointScope, EveryNthSampler, ProbabilitySampler, TokenBucketSampler
+
+    events = []
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def work(self, x):
+            return x
+
+    h.add_checkpoint(lambda fn: Recorder(events, "nth"), sampler=EveryNthSampler(3))
+    h.add_checkpoint(lambda fn: Recorder(events, "never"), CheckpointScope.CALL, ProbabilitySampler(0))
+    h.add_checkpoint(lambda fn: Recorder(events, "bucket"), sampler=TokenBucketSampler(1e-3, burst=2))
+    s = Service()
+    assert [s.work(i) for i in range(7)] == list(range(7))
+    entered = _entered(events)
+    assert entered.count("nth") == 3
+    assert entered.count("never") == 0
+    assert entered.count("bucket") == 2
+
+
+def test_single_sampler_fast_path():
+    from units_python.function_hook import CheckpointScope, EveryNthSampler
+
+    events = []
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def work(self, x):
+            return x
+
+        async def stream(self):
+            yield 1
+
+    h.add_checkpoint(lambda fn: Recorder(events, "nth"), CheckpointScope.CALL, EveryNthSampler(2))
+    s = Service()
+    # the wrapper samples once per call, skipped calls never reach the checkpoint
+    assert [s.work(i) for i in range(6)] == list(range(6))
+    assert _entered(events) == ["nth"] * 3
+
+    async def consume():
+        return [x for _ in range(4) async for x in s.stream()]
+
+    import asyncio
+    events.clear()
+    assert asyncio.run(consume()) == [1] * 4
+    assert _entered(events) == ["nth"] * 2
+
+    # a later registration ends the fast path, every checkpoint is seen again
+    events.clear()
+    h.add_checkpoint(lambda fn: Recorder(events, "all"))
+    for i in range(4):
+        s.work(i)
+    assert _entered(events).count("all") == 4
+    assert _entered(events).count("nth") == 2
+
+
+def test_unhook_and_switch():
+    events = []
+
+    class Base:
+        def base(self):
+            return "base"
+
+    class A(Base):
+        def a(self):
+            return "a"
+
+    class B(Base):
+        @staticmethod
+        def b():
+            return "b"
+
+    originals = dict(A.__dict__), dict(B.__dict__), dict(Base.__dict__)
+    h = Hook()
+    h.add_checkpoint(Recorder.factory(events))
+    h.hook(A)
+    h.hook(B)
+    assert (A().a(), A().base(), B.b()) == ("a", "base", "b")
+    assert _entered(events) == ["a", "base", "b"]
+
+    events.clear()
+    h.disable(A)
+    assert (A().a(), A().base(), B.b()) == ("a", "base", "b")
+    assert _entered(events) == ["b"]
+    h.enable(A)
+    h.enabled = False
+    assert (A().a(), B().base(), B.b()) == ("a", "base", "b")
+    assert _entered(events) == ["b"]
+    h.enabled = True
+
+    events.clear()
+    h.unhook(A)
+    assert A.__dict__["a"] is originals[0]["a"]
+    assert Base.__dict__["base"] is not originals[2]["base"]
+    assert (A().a(), A().base(), B.b()) == ("a", "base", "b")
+    assert _entered(events) == ["base", "b"]
+
+    h.unhook(B)
+    assert dict(B.__dict__) == originals[1]
+    assert dict(Base.__dict__) == originals[2]
+
+    events.clear()
+    h.hook(A)
+    assert A().a() == "a"
+    assert _entered(events) == ["a"]
+
+
+def test_wrapper_code_cache():
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def first(self, x, *, y=1):
+            return x + y
+
+        def second(self, x, *, y=2):
+            return x * y
+
+        def other(self, z):
+            return z
+
+    assert Service.first.__code__.co_code == Service.second.__code__.co_code
+    assert Service.first.__code__.co_code != Service.other.__code__.co_code
+    assert Service.second.__qualname__.endswith("Service.second")
+    assert (Service().first(1), Service().second(3), Service().other(4)) == (2, 6, 4)
+
+    # the shared code is renamed per function, so profilers keep the hooked methods apart
+    import cProfile
+    import pstats
+
+    s = Service()
+    profile = cProfile.Profile()
+    profile.runcall(lambda: (s.first(1), s.second(1), s.second(2)))
+    calls = {name: stats[1] for (filename, _, name), stats in pstats.Stats(profile).stats.items()
+             if filename.startswith("<hook wrapper")}
+    assert calls == {"first": 1, "second": 2}
+    assert Service.second.__code__.co_name == "second"
+
+
+def test_lazy_hook():
+    events = []
+
+    h = Hook()
+    h.add_checkpoint(Recorder.factory(events))
+
+    class Base:
+        def base(self):
+            return "base"
+
+    @h.hook(lazy=True)
+    class Service(Base):
+        def work(self, x):
+            return x
+
+        @classmethod
+        def create(cls):
+            return cls()
+
+    stub = Service.__dict__["work"]
+    assert not isinstance(stub, types.FunctionType)
+    s = Service.create()
+    assert (s.work(1), s.base()) == (1, "base")
+    assert isinstance(Service.__dict__["work"], types.FunctionType)
+    assert isinstance(Service.__dict__["create"], classmethod)
+    assert _entered(events) == ["create", "work", "base"]
+
+    h.unhook(Service)
+    assert Service.__dict__["work"].__code__.co_name == "work"
+    assert Base.__dict__["base"].__code__.co_name == "base"
+
+
+def test_shared_argument_view():
+    events = []
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def keyword(self, a, *, b=2, **c):
+            return a + b
+
+        def positional(self, a, b=2):
+            return a + b
+
+    h.add_checkpoint(Recorder.factory(events, arguments=True))
+    h.add_checkpoint(Recorder.factory(events, arguments=True))
+    s = Service()
+    assert s.keyword(1, d=3) == 3
+    seen = [event[3] for event in events if event[1] == "enter"]
+    assert seen[0] is seen[1] and seen[0] == {"b": 2, "d": 3}
+    try:
+        seen[0]["b"] = 5
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("checkpoint arguments must be read-only")
+
+    events.clear()
+    assert s.positional(1) == 3
+    seen = [event[3] for event in events if event[1] == "enter"]
+    assert seen[0] is seen[1] and len(seen[0]) == 0
+
+
+def test_validate():
+    import asyncio
+    import typing
+
+    h = Hook(validate=True)
+
+    @h.hook
+    class Service:
+        def work(self, a: int, b: typing.Optional[str] = None, *c: float, d: typing.Tuple[int, str] = (0, "")):
+            return a
+
+        async def run(self, a: int):
+            return a
+
+        def forward(self, a: "Undefined"):
+            return a
+
+        def anything(self, a: typing.Optional[typing.Any], b: typing.Union[int, typing.Any] = 0):
+            return a, b
+
+    s = Service()
+    assert s.work(1, "b", 1., 2., d=(1, "d")) == 1
+    assert s.work(1) == 1
+    assert s.work(1, None, 1, 2.) == 1  # an int is a valid float argument
+    for args, kwargs in (((1., ), {}), ((1, 2), {}), ((1, None, "c"), {}), ((1,), {"d": (1, 2)})):
+        try:
+            s.work(*args, **kwargs)
+        except TypeError as e:
+            assert "Service.work() argument" in str(e)
+        else:
+            raise AssertionError(f"invalid arguments accepted: {args} {kwargs}")
+    assert asyncio.run(s.run(1)) == 1
+    try:
+        asyncio.run(s.run("1"))
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("invalid coroutine argument accepted")
+    assert s.forward("anything") == "anything"
+    assert s.anything("a", "b") == ("a", "b")
+    # validation does not depend on checkpoints being enabled
+    h.disable()
+    try:
+        s.work("1")
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("disabled hook skipped validation")
+
+
+def test_hook_module():
+    import textwrap
+
+    module = types.ModuleType("pipeline")
+    exec(textwrap.dedent("""
+        from os.path import join
+
+        def load(x):
+            return parse(x) + 1
+
+        def parse(x):
+            return x * 2
+
+        def _helper(x):
+            return x
+
+        alias = parse
+    """), module.__dict__)
+    original_parse = module.parse
+    events = []
+    h = Hook()
+    h.add_checkpoint(Recorder.factory(events))
+    h.hook_module(module, exclude=["_*"])
+    assert h.is_hooked(module)
+    assert module.load(1) == 3 and module.alias(1) == 2 and module._helper(1) == 1
+    assert _entered(events) == ["load", "parse", "parse"]
+    assert module.alias is module.parse and module.parse.__wrapped__ is original_parse
+    assert module.join.__module__ != "pipeline"
+
+    events.clear()
+    h.disable(module)
+    module.load(1)
+    assert _entered(events) == []
+    h.enable(module)
+    h.hook_module(module)
+    module._helper(1)
+    assert _entered(events) == ["_helper"]
+
+    @h.hook_function
+    def free(x: int):
+        return x
+
+    events.clear()
+    assert free(1) == 1 and h.is_hooked(free)
+    h.disable()
+    free(1)
+    h.enable()
+    free(1)
+    assert _entered(events) == ["free", "free"]
+
+    h.unhook_module(module)
+    assert module.parse is original_parse and module.alias is original_parse
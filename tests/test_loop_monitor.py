@@ -0,0 +1,74 @@
+def test():
+    from units_python.loop_monitor import LoopMonitor
+
+    stalls = []
+    monitor = LoopMonitor(.001, stalls.append, keep=2)
+    monitor.record_dispatch(10, 20)
+    monitor.record_step(3_000_000, "a")
+    monitor.record_step(1_000_000, "b")
+    monitor.record_step(2_000_000, "c")
+    monitor.record_dispatch(5_000_000, 10)
+
+    assert [stall.culprit for stall in stalls] == ["a", "b", "c", None]
+    assert [stall.duration_ns for stall in monitor.stalls] == [5_000_000, 3_000_000]
+    snapshot = monitor.snapshot()
+    assert snapshot["dispatches"] == 2 and snapshot["steps"] == 3 and snapshot["stalls"] == 4
+    assert snapshot["step_max_ns"] == 3_000_000
+    monitor.reset()
+    assert monitor.stalls == [] and monitor.snapshot()["steps"] == 0
+
+
+def test_qt_asyncio():
+    import asyncio
+    import time
+
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.loop_monitor import LoopMonitor
+    from units_python.qt_asyncio import QtAsyncio
+
+    app = QApplication.instance() or QApplication()
+    monitor = LoopMonitor(.05)
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop, monitor=monitor)
+
+    async def _block():
+        await asyncio.sleep(0)
+        time.sleep(.1)
+        await asyncio.sleep(0)
+        app.exit(0)
+
+    task = qt_asyncio.create_task(_block())
+    app.exec_()
+
+    steps = [stall for stall in monitor.stalls if stall.kind == "step"]
+    assert steps and task in steps[0].culprit
+    assert monitor.snapshot()["dispatches"] > 0
+
+
+def test_trio_qt():
+    import time
+
+    import trio
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.loop_monitor import LoopMonitor
+    from units_python.trio_qt import TrioQt
+
+    app = QApplication.instance() or QApplication()
+    monitor = LoopMonitor(.05)
+    trio_qt = TrioQt(app, monitor)
+
+    async def _block():
+        await trio.sleep(0)
+        time.sleep(.1)
+
+    async def _main():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(_block, name="blocker")
+
+    trio_qt.run(_main)
+
+    steps = [stall for stall in monitor.stalls if stall.kind == "step"]
+    assert steps and steps[0].culprit.name == "blocker"
+    assert monitor.snapshot()["dispatches"] > 0
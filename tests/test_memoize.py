@@ -0,0 +1,130 @@
+import threading
+import time
+
+from units_python.function_hook import Hook
+from units_python.memoize import Memoizer
+from units_python.profiling import Profiler
+
+
+def test():
+    h = Hook()
+    calls = []
+
+    @h.hook
+    class Service:
+        def square(self, x, *, scale=1):
+            calls.append(x)
+            return x * x * scale
+
+        def fail(self, x):
+            calls.append(x)
+            raise ValueError(x)
+
+        def items(self, x):
+            yield x
+
+    profiler = Profiler().install(h)
+    memoizer = Memoizer(maxsize=2).install(h)
+    s = Service()
+    assert [s.square(2), s.square(2), s.square(2, scale=2), s.square(3), s.square(2)] == [4, 4, 8, 9, 4]
+    assert calls == [2, 2, 3, 2]
+    # checkpoints installed before the memoizer still see every call
+    assert {row["name"].rsplit(".", 1)[-1]: row["calls"] for row in profiler.snapshot()}["square"] == 5
+    for _ in range(2):
+        try:
+            s.fail(1)
+        except ValueError:
+            pass
+    assert list(s.items(1)) == list(s.items(1)) == [1]
+    assert calls[-2:] == [1, 1]
+    stats = {row["name"].rsplit(".", 1)[-1]: row for row in memoizer.snapshot()}
+    assert set(stats) == {"square", "fail"}
+    assert stats["square"]["hits"] == 1 and stats["square"]["misses"] == 4
+    assert stats["square"]["evictions"] == 2 and stats["square"]["size"] == 2
+    assert stats["fail"]["misses"] == 2 and stats["fail"]["size"] == 0
+
+
+def test_ttl_and_single_flight():
+    h = Hook()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    @h.hook
+    class Service:
+        def slow(self, x):
+            calls.append(x)
+            time.sleep(.1)
+            return [x]
+
+    memoizer = Memoizer(ttl=.05).install(h)
+    s = Service()
+    results = []
+
+    def _call():
+        barrier.wait()
+        results.append(s.slow(1))
+
+    threads = [threading.Thread(target=_call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert s.slow(1) is results[0]
+    time.sleep(.06)
+    s.slow(1)
+    assert calls == [1, 1]
+    stats = memoizer.snapshot()[0]
+    assert stats["waits"] == 7 and stats["expirations"] == 1
+
+
+def test_released_flight_and_keys():
+    from units_python.function_hook import _NO_KWARGS
+
+    h = Hook()
+    calls = []
+
+    class Abort(BaseException):
+        pass
+
+    @h.hook
+    class Service:
+        def f(self, a, b, **kw):
+            calls.append((a, b, kw))
+            if a is None:
+                raise Abort()
+            return a, b, kw
+
+    memoizer = Memoizer().install(h)
+    s = Service()
+    # positional and keyword arguments never share a key
+    assert s.f(1, 2, k=3) == (1, 2, {"k": 3})
+    assert s.f((1, 2), (("k", 3),)) == ((1, 2), (("k", 3),), {})
+    assert len(calls) == 2
+
+    # a BaseException releases the flight, the next identical call runs instead of waiting forever
+    def _abort():
+        try:
+            s.f(None, 0)
+        except Abort:
+            calls.append("aborted")
+
+    _abort()
+    thread = threading.Thread(target=_abort)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert calls.count("aborted") == 2
+
+    result = []
+
+    # a call that never reaches exit or exception releases its flight once the checkpoint is dropped
+    checkpoint = memoizer.checkpoint(Service.f.__wrapped__)
+    assert checkpoint.enter((s, 5, 5), _NO_KWARGS) is None
+    del checkpoint
+    thread = threading.Thread(target=lambda: result.append(s.f(5, 5)))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert result[-1] == (5, 5, {})
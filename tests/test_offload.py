@@ -0,0 +1,66 @@
+def _square(x: int):
+    return x * x
+
+
+def test_asyncio():
+    import asyncio
+    import threading
+
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.qt_asyncio import AsyncioOffload, QtAsyncio
+
+    app = QApplication.instance() or QApplication()
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop)
+    progress = []
+    result = {}
+
+    async def _main():
+        with AsyncioOffload(processes=True, max_workers=2) as offload:
+            result["run"] = await offload.run(_square, 7)
+            result["map"] = await offload.map(_square, range(100), 8, lambda *item: progress.append(
+                (item, threading.current_thread() is threading.main_thread())))
+        app.exit(0)
+
+    qt_asyncio.create_task(_main())
+    app.exec_()
+
+    assert result["run"] == 49
+    assert result["map"] == [x * x for x in range(100)]
+    app.processEvents()
+    assert progress[-1] == ((100, 100), True)
+    assert all(in_main for _, in_main in progress)
+
+
+def test_trio_cancel():
+    import threading
+
+    import trio
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.trio_qt import TrioOffload, TrioQt
+
+    app = QApplication.instance() or QApplication()
+    trio_qt = TrioQt(app)
+    release = threading.Event()
+    started = []
+    result = {}
+
+    def _block(x: int):
+        started.append(x)
+        release.wait(5)
+        return x
+
+    async def _main():
+        with TrioOffload(max_workers=1) as offload:
+            assert await offload.run(_square, 3) == 9
+            with trio.move_on_after(.1):
+                await offload.map(_block, range(10))
+            release.set()
+            result["map"] = await offload.map(_square, range(5), 2)
+
+    trio_qt.run(_main)
+
+    assert started == [0]
+    assert result["map"] == [0, 1, 4, 9, 16]
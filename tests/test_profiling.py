@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+from units_python.function_hook import Hook
+from units_python.profiling import Profiler
+
+hook = Hook()
+profiler = Profiler().install(hook)
+
+
+@hook.hook
+class Demo:
+    def fast(self):
+        pass
+
+    def slow(self):
+        time.sleep(.002)
+
+    def fail(self):
+        raise ValueError()
+
+    async def wait(self, delay: float):
+        await asyncio.sleep(delay)
+
+    async def stream(self):
+        for i in range(3):
+            yield i
+
+
+def test():
+    d = Demo()
+    for _ in range(10):
+        d.fast()
+    d.slow()
+    try:
+        d.fail()
+    except ValueError:
+        pass
+
+    snapshot = {item["name"].rsplit(".", 1)[-1]: item for item in profiler.snapshot()}
+    assert {name: item["calls"] for name, item in snapshot.items()} == {"fast": 10, "slow": 1, "fail": 1}
+    assert snapshot["fail"]["exceptions"] == 1
+    assert snapshot["slow"]["min_ns"] >= 2_000_000
+    assert sum(snapshot["fast"]["buckets"]) == 10
+
+    table = profiler.table()
+    assert table.splitlines()[2].split()[0].endswith("Demo.slow")
+    assert [item["name"] for item in json.loads(profiler.to_json())][0].endswith("Demo.slow")
+
+    profiler.reset()
+    assert profiler.snapshot() == []
+
+
+def test_concurrent_tasks():
+    profiler.reset()
+    d = Demo()
+
+    async def main():
+        # interleaved awaits of one function each keep their own start
+        await asyncio.gather(d.wait(.05), d.wait(.001))
+
+    asyncio.run(main())
+    item, = [item for item in profiler.snapshot() if item["name"].endswith("Demo.wait")]
+    assert item["calls"] == 2
+    assert 1_000_000 <= item["min_ns"] < 50_000_000 <= item["max_ns"]
+
+
+def test_abandoned_async_generators():
+    profiler.reset()
+    d = Demo()
+
+    async def main():
+        for _ in range(1000):
+            async for _ in d.stream():
+                break
+            await asyncio.sleep(0)  # lets the finalizer's aclose task run
+
+    # the abandoned generators are closed by the loop's finalizer, each records its own start
+    asyncio.run(main())
+    item, = [item for item in profiler.snapshot() if item["name"].endswith("Demo.stream")]
+    assert item["calls"] == 1000
+    assert item["exceptions"] == 0
@@ -6,7 +6,7 @@ def test():
 
     from units_python.qt_asyncio import QtAsyncio
 
-    app = QApplication()
+    app = QApplication.instance() or QApplication()
     timer = QTimer()
     _run_num = [0, 0]
 
@@ -28,3 +28,221 @@ def test():
 
     assert _run_num[0] != 0
     assert _run_num[1] != 0
+
+
+def test_idle_timer_and_io():
+    import asyncio
+    import socket
+    import threading
+    import time
+
+    from PySide2.QtCore import QCoreApplication
+
+    from units_python.qt_asyncio import QtAsyncio
+
+    app = QCoreApplication.instance() or QCoreApplication()
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop)
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    result = {}
+
+    async def _wait():
+        started = time.perf_counter()
+        await asyncio.sleep(.2)
+        result["slept"] = time.perf_counter() - started
+        threading.Timer(.1, writer.send, (b"ping",)).start()
+        result["received"] = await loop.sock_recv(reader, 4)
+        app.exit(0)
+
+    qt_asyncio.create_task(_wait())
+    cpu = time.process_time()
+    app.exec_()
+    cpu = time.process_time() - cpu
+    reader.close()
+    writer.close()
+    loop.close()
+
+    assert .2 <= result["slept"] < .3
+    assert result["received"] == b"ping"
+    assert cpu < .15
+
+
+def test_schedule_policy():
+    import asyncio
+    import time
+
+    from PySide2.QtCore import QCoreApplication, QTimer
+
+    from units_python.qt_asyncio import QtAsyncio, SchedulePolicy
+
+    app = QCoreApplication.instance() or QCoreApplication()
+    budgets = []
+
+    def run(policy: SchedulePolicy, busy: float = 0.):
+        timer = QTimer()
+        counter = [0, 0]
+
+        def _timeout():
+            counter[0] += 1
+            if busy:
+                budgets.append(policy.budget)
+                time.sleep(busy)
+
+        async def _spin():
+            for _ in range(1 << 12):
+                await asyncio.sleep(0)
+                counter[1] += 1
+            app.exit(0)
+
+        timer.timeout.connect(_timeout)  # noqa
+        loop = asyncio.new_event_loop()
+        QtAsyncio(loop, policy).create_task(_spin())
+        timer.start(0)
+        app.exec_()
+        timer.stop()
+        loop.close()
+        return counter
+
+    ticks, iterations = run(SchedulePolicy(budget=.005))
+    assert iterations == 1 << 12
+    assert 0 < ticks < iterations / 4
+
+    policy = SchedulePolicy(budget=.005, adaptive=True)
+    ticks, iterations = run(policy)
+    assert iterations == 1 << 12
+    assert ticks > 0
+    assert policy.budget <= .005
+
+    # a Qt slot blocking for 2 ms holds back every batch's event, the budget shrinks towards min_budget
+    policy = SchedulePolicy(budget=.008, adaptive=True, min_budget=.001)
+    ticks, iterations = run(policy, busy=.002)
+    assert iterations == 1 << 12
+    assert sorted(budgets)[len(budgets) // 2] <= .002
+
+
+def test_event_loop():
+    import asyncio
+    import sys
+    import threading
+
+    from PySide2.QtCore import QCoreApplication, QTimer
+
+    from units_python.qt_asyncio import QtEventLoop, QtEventLoopPolicy
+
+    app = QCoreApplication.instance() or QCoreApplication()
+    result = {}
+
+    async def _main():
+        loop = asyncio.get_running_loop()
+        assert isinstance(loop, QtEventLoop)
+
+        slot_loop = loop.create_future()
+        QTimer.singleShot(10, lambda: slot_loop.set_result(asyncio.get_running_loop()))
+        result["slot"] = await slot_loop
+
+        later = loop.create_future()
+        loop.call_later(.05, later.set_result, "later")
+        result["later"] = await later
+
+        result["executor"] = await loop.run_in_executor(None, threading.get_ident)
+
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", "print('child')", stdout=asyncio.subprocess.PIPE)
+        stdout, _ = await process.communicate()
+        result["subprocess"] = stdout.strip()
+        return loop
+
+    asyncio.set_event_loop_policy(QtEventLoopPolicy())
+    try:
+        loop = asyncio.run(_main())
+    finally:
+        asyncio.set_event_loop_policy(None)
+
+    assert result["slot"] is loop
+    assert result["later"] == "later"
+    assert result["executor"] != threading.get_ident()
+    assert result["subprocess"] == b"child"
+
+    loop = QtEventLoop()
+    asyncio.set_event_loop(loop)
+
+    async def _exit():
+        await asyncio.sleep(.01)
+        result["running"] = asyncio.get_running_loop()
+        app.exit(0)
+
+    loop.create_task(_exit())
+    app.exec_()
+    asyncio.set_event_loop(None)
+    loop.close()
+    assert result["running"] is loop
+
+
+def test_qt_slot_wakes_loop():
+    import asyncio
+    import time
+
+    from PySide2.QtCore import QCoreApplication, QTimer
+
+    from units_python.qt_asyncio import QtAsyncio
+
+    app = QCoreApplication.instance() or QCoreApplication()
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop)
+    result = {}
+
+    async def _wait():
+        started = time.perf_counter()
+        future = loop.create_future()
+        # the loop is idle between batches when the slot resolves the future
+        QTimer.singleShot(100, lambda: future.set_result("slot"))
+        result["future"] = await future
+        result["resumed"] = time.perf_counter() - started
+
+        called = loop.create_future()
+        QTimer.singleShot(10, lambda: loop.call_soon(called.set_result, "call_soon"))
+        result["call_soon"] = await called
+        app.exit(0)
+
+    qt_asyncio.create_task(_wait())
+    guard = QTimer()
+    guard.setSingleShot(True)
+    guard.timeout.connect(lambda: app.exit(1))  # noqa
+    guard.start(2000)
+    assert app.exec_() == 0
+    guard.stop()
+    qt_asyncio.close()
+
+    assert result["future"] == "slot"
+    assert result["call_soon"] == "call_soon"
+    assert .09 <= result["resumed"] < .3  # single shot timers are coarse, they may fire up to 5% early
+
+
+def test_driver_released_without_gc():
+    import asyncio
+    import gc
+
+    from PySide2.QtCore import QCoreApplication
+
+    from units_python.qt_asyncio import QtAsyncio, QtAsyncioObject
+
+    def _qt_objects():
+        return sum(isinstance(o, QtAsyncioObject) for o in gc.get_objects())
+
+    app = QCoreApplication.instance() or QCoreApplication()  # noqa
+    loop = asyncio.new_event_loop()
+    gc.disable()
+    try:
+        before = _qt_objects()
+        qt_asyncio = QtAsyncio(loop)
+        assert _qt_objects() == before + 1
+        # the patched call_soon/call_at must not keep the driver's QObjects alive for the cyclic gc,
+        # which could free them from another thread
+        del qt_asyncio
+        assert _qt_objects() == before
+        loop.call_soon(loop.stop)
+        loop.run_forever()
+    finally:
+        gc.enable()
+        loop.close()
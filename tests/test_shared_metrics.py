@@ -0,0 +1,60 @@
+import concurrent.futures
+import multiprocessing
+import warnings
+
+from units_python.function_hook import Hook
+from units_python.shared_metrics import SharedMetrics
+
+_hook = Hook()
+
+
+@_hook.hook
+class _Worker:
+    def work(self, x):
+        if x < 0:
+            raise ValueError(x)
+        return x
+
+
+def _init(name, counter):
+    global _metrics
+    _metrics = SharedMetrics.attach(name, counter).install(_hook)
+
+
+def _run(x):
+    try:
+        _Worker().work(x)
+    except ValueError:
+        pass
+    return _metrics.slot
+
+
+def test():
+    metrics = SharedMetrics.create(processes=4, functions=8)
+    try:
+        counter = multiprocessing.Value("i", 0)
+        with concurrent.futures.ProcessPoolExecutor(
+                3, mp_context=multiprocessing.get_context("fork"),
+                initializer=_init, initargs=(metrics.name, counter)) as pool:
+            slots = set(pool.map(_run, [1, 2, -3] * 20))
+        assert slots <= {0, 1, 2} and counter.value <= 3
+        assert sum(pid != 0 for pid in metrics.pids()) == counter.value
+
+        row, = metrics.snapshot()
+        assert row["name"].endswith("_Worker.work")
+        assert row["calls"] == 60 and row["exceptions"] == 20
+        assert sum(row["buckets"]) == 60 and 0 < row["min_ns"] <= row["p50_ns"] <= row["max_ns"]
+        assert "_Worker.work" in metrics.table()
+
+        local = SharedMetrics.attach(metrics.name, 3)
+        assert local.record("a") == local.record("a")
+        for i in range(7):
+            local.record(str(i))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            assert local.record("overflow") is None
+        assert len(caught) == 1
+        local.close()
+    finally:
+        metrics.close()
+        metrics.unlink()
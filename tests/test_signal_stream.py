@@ -0,0 +1,92 @@
+def test_asyncio():
+    import asyncio
+    import threading
+
+    from PySide2.QtCore import QObject, Signal
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.qt_asyncio import AsyncioSignalStream, QtAsyncio
+    from units_python.signal_stream import StreamPolicy
+
+    class Emitter(QObject):
+        value = Signal(int)
+        pair = Signal(int, str)
+
+    app = QApplication.instance() or QApplication()
+    loop = asyncio.new_event_loop()
+    qt_asyncio = QtAsyncio(loop)
+    emitter = Emitter()
+    result = {}
+
+    async def _main():
+        async with AsyncioSignalStream(emitter.value, 4) as values:
+            for i in range(10):
+                emitter.value.emit(i)
+            result["dropped"] = values.dropped
+            result["oldest"] = [await values.receive() for _ in range(4)]
+
+        latest = AsyncioSignalStream(emitter.value, policy=StreamPolicy.COALESCE_LATEST)
+        for i in range(10):
+            emitter.value.emit(i)
+        result["latest"] = await latest.receive()
+        latest.close()
+
+        pairs = AsyncioSignalStream(emitter.pair, 2, StreamPolicy.BLOCK)
+        thread = threading.Thread(target=lambda: [emitter.pair.emit(i, str(i)) for i in range(5)])
+        thread.start()
+        received = []
+        async for pair in pairs:
+            received.append(pair)
+            if len(received) == 5:
+                pairs.close()
+        thread.join()
+        result["block"] = received
+        app.exit(0)
+
+    qt_asyncio.create_task(_main())
+    app.exec_()
+
+    assert result["dropped"] == 6
+    assert result["oldest"] == [6, 7, 8, 9]
+    assert result["latest"] == 9
+    assert result["block"] == [(i, str(i)) for i in range(5)]
+
+
+def test_trio():
+    import trio
+    from PySide2.QtCore import QObject, Signal
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.signal_stream import StreamPolicy
+    from units_python.trio_qt import TrioQt, TrioSignalStream
+
+    class Emitter(QObject):
+        clicked = Signal()
+
+    app = QApplication.instance() or QApplication()
+    trio_qt = TrioQt(app)
+    emitter = Emitter()
+    result = {}
+
+    async def _main():
+        clicks = TrioSignalStream(emitter.clicked, 2, StreamPolicy.BLOCK)
+        for _ in range(5):
+            emitter.clicked.emit()
+        result["dropped"] = clicks.dropped
+        async with clicks:
+            result["received"] = [await clicks.receive(), await clicks.receive()]
+            with trio.move_on_after(.05) as scope:
+                await clicks.receive()
+            result["waited"] = scope.cancelled_caught
+        result["closed"] = clicks.closed
+        async with TrioSignalStream(emitter.clicked) as stream:
+            trio.lowlevel.current_trio_token().run_sync_soon(emitter.clicked.emit)
+            with trio.fail_after(1):
+                result["next"] = await stream.receive()
+
+    trio_qt.run(_main)
+
+    assert result["dropped"] == 3
+    assert result["received"] == [None, None] and result["waited"]
+    assert result["closed"]
+    assert result["next"] is None
@@ -55,6 +55,9 @@ def test():
             f"{formal('_b')}={actual('_b')}",
             f"{formal('_c')}={actual('_c')}",
             f"**{actual('_d')}")
+    assert sig.pack_statement(actual) == \
+           ((actual("_a"), actual("_b")),
+            (f"'_c': {actual('_c')}", f"**{actual('_d')}"))
 
     def f2(_a: dict = None, /, _b: list = any, *_c: tuple, **_d: map): pass
 
@@ -86,6 +89,73 @@ def test():
             })
     assert sig.call_statement(formal, actual) == \
            (f"{actual('_a')}",
-            f"{formal('_b')}={actual('_b')}",
+            f"{actual('_b')}",
             f"*{actual('_c')}",
             f"**{actual('_d')}")
+    assert sig.pack_statement(actual) == \
+           ((actual("_a"), actual("_b"), f"*{actual('_c')}"),
+            (f"**{actual('_d')}",))
+
+
+def test_cached_model():
+    from units_python.statement_build import ParameterInfo
+    from units_python.units import ParameterKind
+
+    def f(a: int, /, b=1, *c, d: str, **e): pass
+
+    sig = Signature(f)
+    assert Signature(f).parameters is sig.parameters
+    assert all(isinstance(par, ParameterInfo) for par in sig.parameters)
+    assert sig.shape == (("a", ParameterKind.POSITIONAL_ONLY, False),
+                         ("b", ParameterKind.POSITIONAL_OR_KEYWORD, True),
+                         ("c", ParameterKind.VAR_POSITIONAL, False),
+                         ("d", ParameterKind.KEYWORD_ONLY, False),
+                         ("e", ParameterKind.VAR_KEYWORD, False))
+    assert Signature.traversal_parameters(sig.signature.parameters, lambda name, _: name) == \
+           (("a",), ("b",), ("c",), ("d",), ("e",))
+    try:
+        sig.parameters[0].name = "x"
+    except AttributeError:
+        pass
+    else:
+        assert False
+
+
+def test_check_statement():
+    import typing
+
+    def f(a: int, b, *c: str, d: typing.Optional[float] = None, e: typing.Tuple[int, ...] = (), f: "Unknown" = 1,
+          g: typing.Union[int, typing.List[int]] = 0, h: typing.TypeVar("X") = 0, **i: bytes): pass
+
+    checks, constants = Signature(f).check_statement()
+    checks = dict(checks)
+    assert set(checks) == {"a", "c", "d", "e", "g", "i"}
+    assert checks["a"] == "isinstance(a, _check_a_0)" and constants["_check_a_0"] is int
+    assert checks["c"] == "all(isinstance(item0, _check_c_0) for item0 in c)"
+    assert checks["d"] == "d is _default_d or isinstance(d, _check_d_0)"
+    assert constants["_check_d_0"] == (float, int, type(None))
+    assert checks["e"] == "e is _default_e or isinstance(e, tuple) and all(isinstance(item0, _check_e_0) for item0 in e)"
+    assert checks["i"] == "all(isinstance(item0, _check_i_0) for item0 in i.values())"
+
+    def _eval(name, value):
+        return eval(checks[name], {**constants, f"_default_{name}": object(), name: value})
+
+    assert _eval("g", 1) and _eval("g", [1]) and not _eval("g", "1")
+    assert _eval("e", (1, 2)) and not _eval("e", (1, "2")) and not _eval("e", [1])
+
+    # PEP 484 numeric tower
+    def n(x: float, y: complex, z: typing.Tuple[float, ...]): pass
+
+    checks, constants = Signature(n).check_statement()
+    checks = dict(checks)
+    assert eval(checks["x"], {**constants, "x": 1}) and eval(checks["x"], {**constants, "x": True})
+    assert not eval(checks["x"], {**constants, "x": "1"}) and not eval(checks["x"], {**constants, "x": 1j})
+    assert all(eval(checks["y"], {**constants, "y": y}) for y in (1, 1., 1j))
+    assert eval(checks["z"], {**constants, "z": (1, 2.)})
+
+    # an arm accepting anything leaves the whole union unchecked
+    def u(a: typing.Optional[typing.Any], b: typing.Union[int, typing.Any], c: typing.Union[str, object],
+          d: typing.List[typing.Optional[typing.Any]]): pass
+
+    checks, constants = Signature(u).check_statement()
+    assert dict(checks) == {"d": "isinstance(d, _check_d_0)"} and constants["_check_d_0"] is list
@@ -0,0 +1,188 @@
+import asyncio
+import io
+import json
+
+from units_python.function_hook import Hook
+from units_python.tracing import Tracer
+
+
+def _spans(events):
+    return {event["args"]["span"]: event for event in events if event["ph"] == "X"}
+
+
+def test():
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def outer(self):
+            self.inner()
+            self.inner()
+
+        def inner(self):
+            pass
+
+        async def request(self):
+            await asyncio.gather(self.step(), self.step())
+
+        async def step(self):
+            await asyncio.sleep(.01)
+
+    tracer = Tracer().install(h)
+    s = Service()
+    s.outer()
+    asyncio.run(s.request())
+
+    spans = _spans(tracer.events())
+    by_name = {}
+    for event in spans.values():
+        by_name.setdefault(event["name"].rsplit(".", 1)[-1], []).append(event)
+    outer, = by_name["outer"]
+    assert [event["args"]["parent"] for event in by_name["inner"]] == [outer["args"]["span"]] * 2
+    assert all(event["tid"] == outer["tid"] for event in by_name["inner"])
+    request, = by_name["request"]
+    steps = by_name["step"]
+    assert [event["args"]["parent"] for event in steps] == [request["args"]["span"]] * 2
+    # concurrent tasks overlap, so at most one of them shares the parent's track
+    assert len({event["tid"] for event in steps}) == 2
+    for event in steps:
+        assert event["ts"] >= request["ts"] and event["ts"] + event["dur"] <= request["ts"] + request["dur"]
+
+
+def test_stream():
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def work(self, x):
+            if x < 0:
+                raise ValueError(x)
+            return x
+
+    sink = io.StringIO()
+    tracer = Tracer(capacity=4, sink=sink).install(h)
+    s = Service()
+    for i in range(10):
+        s.work(i)
+    try:
+        s.work(-1)
+    except ValueError:
+        pass
+    assert tracer.pending == 3 and tracer.dropped == 0
+    tracer.close()
+
+    events = json.loads(sink.getvalue())
+    assert [event["ph"] for event in events].count("M") == 1
+    spans = _spans(events)
+    assert len(spans) == 11
+    assert [event["args"].get("error", False) for event in spans.values()].count(True) == 1
+
+    memory = Tracer(capacity=2).install(h)
+    for i in range(3):
+        s.work(i)
+    assert memory.dropped == 1
+    buffer = io.StringIO()
+    memory.dump(buffer)
+    assert len(_spans(json.loads(buffer.getvalue()))) == 2
+
+
+def test_track_reuse_and_cancel():
+    h = Hook()
+
+    @h.hook
+    class Service:
+        async def fan_out(self):
+            await asyncio.gather(*(self.leaf() for _ in range(10)))
+
+        async def leaf(self):
+            await asyncio.sleep(0)
+
+        async def hang(self):
+            await asyncio.sleep(10)
+
+        def top(self):
+            pass
+
+    sink = io.StringIO()
+    tracer = Tracer(capacity=256, sink=sink).install(h)
+    s = Service()
+
+    async def main():
+        for _ in range(200):
+            await s.fan_out()
+        # a cancelled call closes its span, the thread's track is free again afterwards
+        task = asyncio.create_task(s.hang())
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+    s.top()
+    tracer.close()
+
+    events = json.loads(sink.getvalue())
+    # tracks follow the peak concurrency, not the number of tasks ever spawned
+    assert len({event["tid"] for event in events}) <= 11
+    assert [event["ph"] for event in events].count("M") == len({event["tid"] for event in events})
+    spans = _spans(events).values()
+    hang, = [event for event in spans if event["name"].endswith("hang")]
+    top, = [event for event in spans if event["name"].endswith("top")]
+    assert hang["args"]["error"]
+    assert top["tid"] > 0
+
+
+def test_outliving_child():
+    h = Hook()
+
+    @h.hook
+    class Service:
+        def __init__(self):
+            self.detached = None
+
+        async def spawn(self):
+            # the child's first call continues this track while spawn waits
+            self.detached = asyncio.create_task(self.child())
+            await asyncio.sleep(.01)
+
+        async def child(self):
+            await self.leaf()
+            await asyncio.sleep(.03)
+            await self.leaf()
+
+        async def leaf(self):
+            await asyncio.sleep(0)
+
+        async def other(self):
+            await asyncio.sleep(.01)
+
+    tracer = Tracer().install(h)
+    s = Service()
+
+    async def main():
+        await s.spawn()
+        # spawn is closed, child still runs, its track must not be handed to another call tree
+        await s.other()
+        await s.detached
+
+    asyncio.run(main())
+
+    spans = _spans(tracer.events()).values()
+    by_name = {}
+    for event in spans:
+        by_name.setdefault(event["name"].rsplit(".", 1)[-1], []).append(event)
+    spawn, = by_name["spawn"]
+    child, = by_name["child"]
+    assert child["args"]["parent"] == spawn["args"]["span"]
+    assert child["ts"] + child["dur"] > spawn["ts"] + spawn["dur"]
+    assert all(leaf["args"]["parent"] == child["args"]["span"] for leaf in by_name["leaf"])
+    # events sharing a track are disjoint or nested
+    for a in spans:
+        for b in spans:
+            if a is b or a["tid"] != b["tid"]:
+                continue
+            a_end, b_end = a["ts"] + a["dur"], b["ts"] + b["dur"]
+            assert a_end <= b["ts"] or b_end <= a["ts"] \
+                or a["ts"] <= b["ts"] and b_end <= a_end or b["ts"] <= a["ts"] and a_end <= b_end
@@ -0,0 +1,86 @@
+def test():
+    import trio
+    from PySide2.QtCore import QTimer
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.trio_qt import TrioQt
+
+    app = QApplication.instance() or QApplication()
+    trio_qt = TrioQt(app)
+    done = []
+
+    async def _work(i: int):
+        await trio.sleep(0)
+        done.append(i)
+
+    async def _main():
+        async with trio.open_nursery() as nursery:
+            ticked = trio.Event()
+            QTimer.singleShot(0, ticked.set)
+            await ticked.wait()
+            for i in range(1 << 8):
+                nursery.start_soon(_work, i)
+
+    trio_qt.run(_main)
+
+    assert sorted(done) == list(range(1 << 8))
+    assert trio_qt.dispatched >= trio_qt.drains
+    assert trio_qt.posted_events == trio_qt.drains
+    assert trio_qt.pending == 0
+
+
+def test_coalescing():
+    import threading
+
+    import trio
+    from PySide2.QtWidgets import QApplication
+
+    from units_python.trio_qt import TrioQt
+
+    app = QApplication.instance() or QApplication()
+    trio_qt = TrioQt(app)
+    ran = []
+
+    def _flood():
+        # what trio's run_sync_soon_threadsafe does from its io thread
+        for i in range(64):
+            trio_qt._TrioQt__next_loop(lambda: ran.append(i))
+
+    async def _main():
+        threads = [threading.Thread(target=_flood) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        # the Qt thread is busy, the first callback's event stays pending while the others queue behind it
+        for thread in threads:
+            thread.join()
+        await trio.sleep(.01)
+
+    trio_qt.run(_main)
+
+    assert len(ran) == 4 * 64
+    assert trio_qt.max_drain > 1
+    assert trio_qt.posted_events < trio_qt.dispatched
+    assert trio_qt.pending == 0
+
+
+def test_headless():
+    import subprocess
+    import sys
+    import textwrap
+
+    script = textwrap.dedent("""
+        import sys
+
+        import trio
+
+        from units_python.trio_qt import TrioQt
+
+        async def _main():
+            await trio.sleep(.01)
+            print(type(trio_qt.app).__name__, "PySide2.QtWidgets" in sys.modules, flush=True)
+
+        trio_qt = TrioQt()
+        trio_qt.run(_main)
+    """)
+    process = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60)
+    assert process.stdout.split() == ["QCoreApplication", "False"], process.stderr
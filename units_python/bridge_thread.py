@@ -0,0 +1,71 @@
+import threading
+import typing
+
+from PySide2.QtCore import QObject, QThread
+
+
+class BridgeThread(QThread):
+    """
+    a QThread running its own loop bridge (QtAsyncioThread, TrioQtThread)\n
+    start returns once the bridge takes work, submit is thread safe and returns a concurrent.futures.Future,
+    await it from another loop with asyncio.wrap_future or trio_qt.wait_future
+    """
+
+    def __init__(self, parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.__ready = threading.Event()
+        self.__error: typing.Optional[BaseException] = None
+
+    def start(self, priority: QThread.Priority = QThread.InheritPriority):
+        """
+        :raise: 线程中创建 bridge 时抛出的异常
+        """
+        self.__ready.clear()
+        self.__error = None
+        super().start(priority)
+        self.__ready.wait()
+        if self.__error is not None:
+            self.wait()
+            raise self.__error
+
+    def run(self):
+        try:
+            self._serve()
+        except BaseException as e:
+            if not self.__ready.is_set():
+                self.__error = e
+            else:
+                raise
+        finally:
+            self.__ready.set()
+
+    def stop(self, wait: bool = True):
+        """cancel what is still running and end the thread, thread safe"""
+        if self.__ready.is_set():
+            self._stop()
+        if wait:
+            self.wait()
+
+    def _set_ready(self):
+        """called by _serve from the thread once submit works"""
+        self.__ready.set()
+
+    def _serve(self):
+        """runs the bridge in the thread until _stop"""
+        raise NotImplementedError
+
+    def _stop(self):
+        """called from any thread"""
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+__all__ = [
+    "BridgeThread",
+]
@@ -1,5 +1,13 @@
 import abc
+import asyncio
+import collections
+import enum
+import fnmatch
+import functools
 import inspect
+import itertools
+import random
+import threading
 import time
 import traceback
 import types
@@ -9,21 +17,32 @@ import warnings
 from .statement_build import Signature
 from .units import T
 
+_PREFIX = f"_{int(time.time())}"  # keeps names used by the generated wrappers apart from the parameter names
+_NO_KWARGS: typing.Mapping[str, typing.Any] = types.MappingProxyType({})  # functions without keyword only parameters
+# (function kind, parameter shape) -> compiled wrapper module, shared by every Hook
+_wrapper_codes: typing.Dict[tuple, types.CodeType] = {}
+
 
 class _Checkpoint(typing.Protocol):
-    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Dict[str, typing.Any]):
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
         pass
 
     def exit(self, result: typing.Union[None, typing.Tuple[typing.Any]]):
         pass
 
-    def exception(self, exc: Exception):
+    def exception(self, exc: BaseException):
         pass
 
 
 class Checkpoint(abc.ABC):
+    """
+    enter gets the arguments as packed by the wrapper, one tuple and one read-only mapping per call,
+    shared by every checkpoint of that call, keep them as they are or copy with dict(kwargs) before changing\n
+    exception also sees BaseException (asyncio.CancelledError, trio.Cancelled, KeyboardInterrupt), it is re-raised after
+    """
+
     @abc.abstractmethod
-    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Dict[str, typing.Any]):
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
         pass
 
     @abc.abstractmethod
@@ -31,23 +50,506 @@ class Checkpoint(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def exception(self, exc: Exception):
+    def exception(self, exc: BaseException):
+        pass
+
+
+class AroundCheckpoint(Checkpoint):
+    """
+    a checkpoint that may answer the call itself, enter returns (result,) to skip the hooked function
+    or None to let it run\n
+    on an answer the checkpoints entered before it see exit(result), itself and the ones after it are not called again\n
+    only plain functions and coroutine functions can be answered, for generators the return value of enter is ignored
+    """
+
+    @abc.abstractmethod
+    def enter(self,
+              args: typing.Tuple[typing.Any],
+              kwargs: typing.Mapping[str, typing.Any]) -> typing.Optional[typing.Tuple[typing.Any]]:
         pass
 
 
 _CheckpointT = typing.Callable[[types.FunctionType], _Checkpoint]
+_TimerT = typing.Callable[[int, bool], typing.Any]  # (elapsed_ns, failed)
+
+
+class DispatchPolicy(enum.Enum):
+    DROP_NEWEST = "drop_newest"  # discard the event being queued
+    DROP_OLDEST = "drop_oldest"  # discard the oldest queued event
+    BLOCK = "block"  # wait until the dispatcher catches up
+
+
+class CheckpointDispatcher:
+    """
+    bounded event buffer, drained in batches by a background thread (start) or an asyncio task (run)\n
+    put takes no lock while the buffer has room, dropping an event or waiting for room does
+    """
+
+    def __init__(self,
+                 capacity: int = 1 << 14,
+                 policy: DispatchPolicy = DispatchPolicy.DROP_NEWEST,
+                 batch_size: int = 256,
+                 interval: float = .05):
+        """
+        :param capacity: 缓冲区最多容纳的事件数
+        :param policy: 缓冲区满时的处理策略
+        :param batch_size: 每批处理的事件数, 积压达到该数量时立即唤醒后台线程
+        :param interval: 后台线程/任务的最长等待间隔 (秒)
+        """
+        if capacity <= 0 or batch_size <= 0:
+            raise ValueError(f"capacity and batch_size must be positive: {capacity}, {batch_size}")
+        self.__capacity = capacity
+        self.__policy = DispatchPolicy(policy)
+        self.__batch_size = batch_size
+        self.__interval = interval
+        self.__events: typing.Deque[typing.Tuple[typing.Callable, tuple]] = collections.deque()
+        self.__wakeup = threading.Event()
+        self.__not_full = threading.Condition()
+        self.__thread: typing.Optional[threading.Thread] = None
+        self.__drainer: typing.Optional[int] = None  # ident of the thread draining the buffer
+        self.__running = False
+        # producers and flushing threads race, so the counters are only updated under this lock (once per drop/batch)
+        self.__counter_lock = threading.Lock()
+        self.__dropped = 0
+        self.__dispatched = 0
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def pending(self):
+        return len(self.__events)
+
+    @property
+    def submitted(self):
+        """every submitted event ends up dropped, dispatched or pending, exact while no batch is being dispatched"""
+        return self.__dropped + self.__dispatched + len(self.__events)
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def dispatched(self):
+        return self.__dispatched
+
+    @property
+    def running(self):
+        return self.__running
+
+    def put(self, handler: typing.Callable, args: tuple) -> bool:
+        """
+        queue handler(*args)
+        :return: False if the event was dropped
+        """
+        events = self.__events
+        if len(events) >= self.__capacity:
+            if self.__policy is DispatchPolicy.DROP_NEWEST:
+                with self.__counter_lock:
+                    self.__dropped += 1
+                return False
+            elif self.__policy is DispatchPolicy.DROP_OLDEST:
+                try:
+                    events.popleft()
+                except IndexError:
+                    pass
+                else:
+                    with self.__counter_lock:
+                        self.__dropped += 1
+            elif not self.__running or threading.get_ident() == self.__drainer:
+                # nobody else is draining, or the drainer is this thread (run on the hooked code's loop),
+                # blocking would never return
+                self.flush()
+            else:
+                self.__wakeup.set()
+                with self.__not_full:
+                    while len(events) >= self.__capacity and self.__running:
+                        self.__not_full.wait(self.__interval)
+        events.append((handler, args))
+        if len(events) >= self.__batch_size:
+            self.__wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """
+        dispatch every queued event on the calling thread
+        :return: 处理的事件数
+        """
+        count = 0
+        while batch := self.__pop_batch():
+            count += self.__dispatch(batch)
+        return count
+
+    def start(self):
+        """drain the buffer on a daemon thread"""
+        if self.__running:
+            raise RuntimeError("dispatcher is already running")
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run_thread, name=type(self).__name__, daemon=True)
+        self.__thread.start()
+
+    async def run(self):
+        """drain the buffer from an asyncio task, until stop is called or the task is cancelled"""
+        if self.__running:
+            raise RuntimeError("dispatcher is already running")
+        self.__running = True
+        self.__drainer = threading.get_ident()
+        try:
+            while self.__running:
+                self.flush()
+                await asyncio.sleep(self.__interval)
+        finally:
+            self.__running = False
+            self.__drainer = None
+            self.flush()
+
+    def stop(self, timeout: typing.Optional[float] = None):
+        """
+        stop the background thread/task\n
+        the thread flushes the queued events before it ends, stop waits for that unless timeout expires first,
+        a run task only sees the request when it next wakes up (within interval), await it to be sure it flushed
+        """
+        self.__running = False
+        self.__wakeup.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def __run_thread(self):
+        self.__drainer = threading.get_ident()
+        while self.__running:
+            self.__wakeup.wait(self.__interval)
+            self.__wakeup.clear()
+            self.flush()
+        self.__drainer = None
+        self.flush()
+
+    def __pop_batch(self):
+        events = self.__events
+        batch = []
+        try:
+            for _ in range(self.__batch_size):
+                batch.append(events.popleft())
+        except IndexError:
+            pass
+        if batch and self.__policy is DispatchPolicy.BLOCK:
+            with self.__not_full:
+                self.__not_full.notify_all()
+        return batch
+
+    def __dispatch(self, batch: typing.Iterable[typing.Tuple[typing.Callable, tuple]]):
+        count = 0
+        for handler, args in batch:
+            try:
+                handler(*args)
+            except Exception as e:
+                warnings.warn(f"dispatch checkpoint error: {handler}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+            count += 1
+        with self.__counter_lock:
+            self.__dispatched += count
+        return count
+
+
+class AsyncCheckpoint(Checkpoint):
+    """
+    checkpoint whose enter/exit/exception only queue the event,
+    on_enter/on_exit/on_exception run later on the dispatcher side
+    """
+
+    def __init__(self, dispatcher: CheckpointDispatcher):
+        self.__put = dispatcher.put
+
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        self.__put(self.on_enter, (args, kwargs))
+
+    def exit(self, result: typing.Union[None, typing.Tuple[typing.Any]]):
+        self.__put(self.on_exit, (result,))
+
+    def exception(self, exc: BaseException):
+        self.__put(self.on_exception, (exc,))
+
+    @abc.abstractmethod
+    def on_enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        pass
+
+    @abc.abstractmethod
+    def on_exit(self, result: typing.Union[None, typing.Tuple[typing.Any]]):
+        pass
+
+    @abc.abstractmethod
+    def on_exception(self, exc: BaseException):
+        pass
+
+
+class BufferedCheckpoint(AsyncCheckpoint):
+    """move an existing checkpoint off the caller's thread"""
+
+    def __init__(self, checkpoint: _Checkpoint, dispatcher: CheckpointDispatcher):
+        super().__init__(dispatcher)
+        self.__checkpoint = checkpoint
+
+    @property
+    def checkpoint(self):
+        return self.__checkpoint
+
+    def on_enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        self.__checkpoint.enter(args, kwargs)
+
+    def on_exit(self, result: typing.Union[None, typing.Tuple[typing.Any]]):
+        self.__checkpoint.exit(result)
+
+    def on_exception(self, exc: BaseException):
+        self.__checkpoint.exception(exc)
+
+
+class CheckpointScope(enum.Enum):
+    FUNCTION = "function"  # instantiated once per hooked function, shared by all calls
+    CALL = "call"  # instantiated on every call, for checkpoints keeping per-call state
+
+
+class Sampler(abc.ABC):
+    """decide, before any argument is packed, whether checkpoints observe the current call"""
+
+    @abc.abstractmethod
+    def bind(self, fn: types.FunctionType) -> typing.Callable[[], bool]:
+        """
+        :param fn: 被 hook 的函数
+        :return: 每次调用时执行, 返回 True 表示采样本次调用
+        """
+
+
+class EveryNthSampler(Sampler):
+    """sample the 1st, (n+1)th, (2n+1)th ... call of each function"""
+
+    def __init__(self, n: int):
+        if n <= 0:
+            raise ValueError(f"n must be positive: {n}")
+        self.__n = n
+
+    def bind(self, fn: types.FunctionType):
+        n = self.__n
+        counter = itertools.count()
+        return lambda: next(counter) % n == 0
+
+
+class ProbabilitySampler(Sampler):
+    """sample each call with the given probability"""
+
+    def __init__(self, probability: float):
+        if not 0 <= probability <= 1:
+            raise ValueError(f"probability must be in [0, 1]: {probability}")
+        self.__probability = probability
+
+    def bind(self, fn: types.FunctionType):
+        probability = self.__probability
+        rand = random.random
+        return lambda: rand() < probability
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def __call__(self):
+        now = time.monotonic()
+        tokens = self.tokens + (now - self.last) * self.rate
+        self.last = now
+        if tokens > self.burst:
+            tokens = self.burst
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return True
+        self.tokens = tokens
+        return False
+
+
+class TokenBucketSampler(Sampler):
+    """sample at most rate calls per second of each function, with bursts of up to burst calls"""
+
+    def __init__(self, rate: float, burst: typing.Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+        self.__rate = rate
+        self.__burst = max(1., rate if burst is None else burst)
+
+    def bind(self, fn: types.FunctionType):
+        return _TokenBucket(self.__rate, self.__burst)
+
+
+class _HookedFunction:
+    __slots__ = ("fn", "enabled", "resolved", "checkpoints", "dynamic", "timers", "sample")
+
+    def __init__(self, fn: types.FunctionType):
+        self.fn = fn
+        self.enabled = True
+        self.resolved = 0  # number of registered factories already applied to fn
+        # checkpoints used by every call, while none of them is sampled or created per call
+        self.checkpoints: typing.Tuple[_Checkpoint, ...] = ()
+        # otherwise every (sample, checkpoint, factory) slot in registration order, decided per call,
+        # exactly one of checkpoint and factory is set
+        self.dynamic: typing.Tuple[typing.Tuple[typing.Optional[typing.Callable[[], bool]],
+                                                typing.Optional[_Checkpoint],
+                                                typing.Optional[_CheckpointT]], ...] = ()
+        # timers of every call, the wrapper keeps the start in a local
+        self.timers: typing.Tuple[_TimerT, ...] = ()
+        # sampler of the only slot, tested by the wrapper before anything else, cleared by every registration
+        self.sample: typing.Optional[typing.Callable[[], bool]] = None
+
+
+class _LazyMethod:
+    """placeholder installed by Hook.hook(cls, lazy=True), replaced by the generated wrapper on first lookup"""
+    __slots__ = ("__materialize", "__cls", "__name")
+
+    def __init__(self, materialize: typing.Callable[[typing.Type, str], typing.Any], cls: typing.Type, name: str):
+        self.__materialize = materialize
+        self.__cls = cls
+        self.__name = name
+
+    def __get__(self, instance, owner=None):
+        return self.__materialize(self.__cls, self.__name).__get__(instance, owner)
+
+    def __repr__(self):
+        return f"<lazy hooked method {self.__cls.__qualname__}.{self.__name}>"
+
+
+# method name -> (original item, installed item, hooked function state)
+_HookedClassT = typing.Dict[str, typing.Tuple[typing.Any, typing.Any, _HookedFunction]]
 
 
 class Hook:
-    def __init__(self):
-        self.__checkpoints: typing.List[_CheckpointT] = []
+    def __init__(self, validate: bool = False):
+        """
+        :param validate: 生成的 wrapper 按参数注解内联 isinstance 检查, 不匹配时抛出 TypeError,
+                         检查与 enabled 无关, 生成器/协程在开始迭代/await 时检查
+        """
+        self.__validate = validate
+        # (factory, scope, sampler), the scope of timer factories is None
+        self.__checkpoints: typing.List[typing.Tuple[typing.Callable[[types.FunctionType], typing.Any],
+                                                     typing.Optional[CheckpointScope],
+                                                     typing.Optional[Sampler]]] = []
+        self.__resolve_lock = threading.Lock()
+        self.__enabled = True
+        self.__disabled: typing.Set[typing.Type] = set()  # classes disabled by disable(cls)
+        self.__roots: typing.Set[typing.Type] = set()  # classes passed to hook
+        self.__hooked: typing.Dict[typing.Type, _HookedClassT] = {}
+        self.__modules: typing.Dict[types.ModuleType, _HookedClassT] = {}  # module -> functions hooked in it
+        self.__functions: typing.Dict[typing.Callable, _HookedFunction] = {}  # wrapper -> state, from hook_function
+
+    def add_checkpoint(self,
+                       checkpoint: _CheckpointT,
+                       scope: CheckpointScope = CheckpointScope.FUNCTION,
+                       sampler: typing.Optional[Sampler] = None):
+        """
+        register checkpoint factory, already hooked functions pick it up on their next call
+        :param checkpoint: 以被 hook 的函数为参数, 返回 checkpoint (或 None 表示忽略该函数)
+        :param scope: checkpoint 实例的复用范围
+        :param sampler: 采样策略, 未被采样的调用不会打包参数也不会创建/调用 checkpoint
+        """
+        self.__register((checkpoint, CheckpointScope(scope), sampler))
+
+    def add_timer(self,
+                  timer: typing.Callable[[types.FunctionType], typing.Optional[_TimerT]],
+                  sampler: typing.Optional[Sampler] = None):
+        """
+        register a latency recorder factory, already hooked functions pick it up on their next call\n
+        the wrapper reads the clock around the call and passes (elapsed_ns, failed) to the recorder,
+        cheaper than a checkpoint keeping per call state, answered calls are timed too
+        :param timer: 以被 hook 的函数为参数, 返回 record(elapsed_ns, failed) (或 None 表示忽略该函数)
+        :param sampler: 采样策略, 未被采样的调用仍然计时, 只是不记录
+        """
+        self.__register((timer, None, sampler))
+
+    def __register(self, registration: typing.Tuple[typing.Callable[[types.FunctionType], typing.Any],
+                                                     typing.Optional[CheckpointScope],
+                                                     typing.Optional[Sampler]]):
+        with self.__resolve_lock:
+            self.__checkpoints.append(registration)
+            # wrappers skip unsampled calls before resolving, make them resolve the new registration first
+            for functions in (*self.__hooked.values(), *self.__modules.values()):
+                for _, _, hooked in functions.values():
+                    hooked.sample = None
+            for hooked in tuple(self.__functions.values()):
+                hooked.sample = None
+
+    def __init_call(self, hooked: _HookedFunction):
+        sampled = hooked.sample is not None  # the wrapper already sampled this call
+        if hooked.resolved != len(self.__checkpoints):
+            self.__resolve(hooked)
+        if not hooked.dynamic:
+            return hooked.checkpoints
+        if sampled and hooked.sample is not None:
+            _, checkpoint, factory = hooked.dynamic[0]
+            return (checkpoint,) if checkpoint is not None else self.__create(hooked.fn, (factory,))
+        checkpoints = ()
+        for sample, checkpoint, factory in hooked.dynamic:
+            if sample is not None and not sample():
+                continue
+            if checkpoint is not None:
+                checkpoints += (checkpoint,)
+            else:
+                checkpoints += self.__create(hooked.fn, (factory,))
+        return checkpoints
 
-    def add_checkpoint(self, checkpoint: _CheckpointT):
-        self.__checkpoints.append(checkpoint)
+    def __resolve(self, hooked: _HookedFunction):
+        with self.__resolve_lock:
+            registered = self.__checkpoints[hooked.resolved:]
+            slots = hooked.dynamic or tuple((None, checkpoint, None) for checkpoint in hooked.checkpoints)
+            for factory, scope, sampler in registered:
+                sample = None
+                if sampler is not None:
+                    try:
+                        sample = sampler.bind(hooked.fn)
+                    except Exception as e:
+                        warnings.warn(f"initial sampler error: {sampler}")
+                        traceback.print_exception(type(e), e, e.__traceback__)
+                        continue
+                if scope is None:
+                    hooked.timers += self.__create_timer(hooked.fn, factory, sample)
+                elif scope is CheckpointScope.CALL:
+                    slots += ((sample, None, factory),)
+                else:
+                    slots += tuple((sample, checkpoint, None) for checkpoint in self.__create(hooked.fn, (factory,)))
+            # one ordered tuple keeps enter/exit in registration order whatever the scope and sampling
+            if any(sample is not None or factory is not None for sample, _, factory in slots):
+                hooked.dynamic = slots
+            else:
+                hooked.checkpoints = tuple(checkpoint for _, checkpoint, _ in slots)
+            hooked.resolved += len(registered)
+            if len(slots) == 1 and not hooked.timers and hooked.resolved == len(self.__checkpoints):
+                hooked.sample = slots[0][0]
+
+    @staticmethod
+    def __create_timer(fn: types.FunctionType,
+                       factory: typing.Callable[[types.FunctionType], typing.Optional[_TimerT]],
+                       sample: typing.Optional[typing.Callable[[], bool]]):
+        try:
+            timer = factory(fn)
+        except Exception as e:
+            warnings.warn(f"initial timer error: {factory}")
+            traceback.print_exception(type(e), e, e.__traceback__)
+            return ()
+        if timer is None:
+            return ()
+        if sample is None:
+            return timer,
+        # the clock is read anyway, unsampled calls are just not recorded
+        return lambda elapsed_ns, failed: sample() and timer(elapsed_ns, failed),
 
-    def __init_call(self, fn: types.FunctionType):
+    @staticmethod
+    def __create(fn: types.FunctionType, factories: typing.Iterable[_CheckpointT]):
         checkpoints = []
-        for checkpoint in self.__checkpoints:
+        for checkpoint in factories:
             try:
                 if cp := checkpoint(fn):
                     checkpoints.append(cp)
@@ -59,13 +561,30 @@ class Hook:
     @staticmethod
     def __before_call(checkpoints: typing.Iterable[_Checkpoint],
                       args: typing.Tuple[typing.Any],
-                      kwargs: typing.Dict[str, typing.Any]):
+                      kwargs: typing.Mapping[str, typing.Any]):
         for checkpoint in checkpoints:
             try:
-                checkpoint.enter(args, kwargs.copy())
+                checkpoint.enter(args, kwargs)
+            except Exception as e:
+                warnings.warn(f"enter checkpoint error: {checkpoint}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+
+    @staticmethod
+    def __around_call(checkpoints: typing.Tuple[_Checkpoint],
+                      args: typing.Tuple[typing.Any],
+                      kwargs: typing.Mapping[str, typing.Any]):
+        """__before_call for functions whose result can be replaced, returns the first answer of an enter"""
+        for i, checkpoint in enumerate(checkpoints):
+            try:
+                answer = checkpoint.enter(args, kwargs)
             except Exception as e:
                 warnings.warn(f"enter checkpoint error: {checkpoint}")
                 traceback.print_exception(type(e), e, e.__traceback__)
+                continue
+            if answer is not None:
+                Hook.__after_call(checkpoints[:i], answer[0])
+                return answer
+        return None
 
     @staticmethod
     def __after_call(checkpoints: typing.Tuple[_Checkpoint], result: typing.Union[None, typing.Tuple[typing.Any]]):
@@ -77,7 +596,16 @@ class Hook:
                 traceback.print_exception(type(e), e, e.__traceback__)
 
     @staticmethod
-    def __exception_call(checkpoints: typing.Tuple[_Checkpoint], exc: Exception):
+    def __time_call(timers: typing.Tuple[_TimerT], elapsed_ns: int, failed: bool):
+        for timer in timers:
+            try:
+                timer(elapsed_ns, failed)
+            except Exception as e:
+                warnings.warn(f"timer error: {timer}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+
+    @staticmethod
+    def __exception_call(checkpoints: typing.Tuple[_Checkpoint], exc: BaseException):
         for checkpoint in checkpoints:
             try:
                 checkpoint.exception(exc)
@@ -85,61 +613,382 @@ class Hook:
                 warnings.warn(f"exception checkpoint error: {checkpoint}")
                 traceback.print_exception(type(e), e, e.__traceback__)
 
-    def hook(self, cls: T) -> T:
+    @property
+    def validate(self):
+        return self.__validate
+
+    @property
+    def enabled(self):
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        self.__enabled = bool(enabled)
+        self.__refresh_enabled()
+
+    def enable(self, cls: typing.Union[None, typing.Type, types.ModuleType] = None):
+        """
+        :param cls: None 表示全局开关, 否则只作用于 cls 及其 mro 中被 hook 的类, 或 hook_module 的模块
+        """
+        if cls is None:
+            self.enabled = True
+        else:
+            self.__disabled.discard(cls)
+            self.__refresh_enabled()
+
+    def disable(self, cls: typing.Union[None, typing.Type, types.ModuleType] = None):
+        """
+        disabled wrappers only read one attribute before calling straight through\n
+        base classes are shared, disabling a class also disables the methods its hooked subclasses inherit from them\n
+        functions from hook_function only follow the global switch
+        :param cls: None 表示全局开关, 否则只作用于 cls 及其 mro 中被 hook 的类, 或 hook_module 的模块
+        """
+        if cls is None:
+            self.enabled = False
+        else:
+            self.__disabled.add(cls)
+            self.__refresh_enabled()
+
+    def is_enabled(self, cls: typing.Union[None, typing.Type, types.ModuleType] = None):
+        if cls is None:
+            return self.__enabled
+        return self.__enabled and not any(c in self.__disabled for c in self.__scope(cls))
+
+    def is_hooked(self, cls: typing.Union[typing.Type, types.ModuleType, typing.Callable]):
+        return cls in self.__roots or cls in self.__modules or cls in self.__functions
+
+    @staticmethod
+    def __scope(cls: typing.Union[typing.Type, types.ModuleType]):
+        return inspect.getmro(cls) if isinstance(cls, type) else (cls,)
+
+    def __refresh_enabled(self):
+        disabled = set()
+        for cls in self.__disabled:
+            disabled.update(self.__scope(cls))
+        for hooked_items in (self.__hooked.items(), self.__modules.items()):
+            for cls, functions in hooked_items:
+                enabled = self.__enabled and cls not in disabled
+                for _, _, hooked in functions.values():
+                    hooked.enabled = enabled
+        for hooked in self.__functions.values():
+            hooked.enabled = self.__enabled
+
+    def hook(self, cls: typing.Optional[T] = None, *, lazy: bool = False) -> T:
+        """
+        hook cls and every class in its mro, classes already hooked by this hook are skipped\n
+        usable as @hook.hook or @hook.hook(lazy=True)
+        :param lazy: 只安装占位描述符, 方法第一次被访问时才生成 wrapper
+        """
+        if cls is None:
+            return functools.partial(self.hook, lazy=lazy)
+        self.__roots.add(cls)
         for c in inspect.getmro(cls):
-            self.__hook(c)
+            if c not in self.__hooked:
+                self.__hooked[c] = self.__hook(c, lazy)
+        if not self.__enabled or self.__disabled:
+            self.__refresh_enabled()
+        return cls
+
+    def unhook(self, cls: typing.Type):
+        """restore the original methods of cls and of its bases that no other hooked class still relies on"""
+        if cls not in self.__roots:
+            raise ValueError(f"class is not hooked: {cls}")
+        self.__roots.discard(cls)
+        self.__disabled.discard(cls)
+        keep = set()
+        for root in self.__roots:
+            keep.update(inspect.getmro(root))
+        for c in tuple(self.__hooked):
+            if c in keep:
+                continue
+            for name, (original, installed, _) in self.__hooked.pop(c).items():
+                if c.__dict__.get(name) is installed:
+                    setattr(c, name, original)
         return cls
 
-    def __hook(self, cls: typing.Type):
-        for name, item in cls.__dict__.items():  # type: str, typing.Any
+    def hook_function(self, fn: T) -> T:
+        """
+        hook a plain function, usable as @hook.hook_function\n
+        only callers going through the returned wrapper are observed, rebinding it is up to the caller
+        """
+        if not isinstance(fn, types.FunctionType):
+            raise TypeError(f"not a function: {fn!r}")
+        hooked = _HookedFunction(fn)
+        hooked.enabled = self.__enabled
+        wrapper = self.__hook_function(fn.__name__, fn, hooked)
+        self.__functions[wrapper] = hooked
+        return wrapper
+
+    def hook_module(self,
+                    module: types.ModuleType,
+                    include: typing.Optional[typing.Iterable[str]] = None,
+                    exclude: typing.Optional[typing.Iterable[str]] = None):
+        """
+        hook the functions defined in module, every name of the module namespace bound to one of them is rebound
+        to its wrapper, so calls between them go through the wrappers,
+        references taken before (from module import fn) keep calling the original, classes are left to hook
+        :param include: fnmatch 模式, 只 hook 名称匹配的函数, None 表示全部
+        :param exclude: fnmatch 模式, 跳过名称匹配的函数
+        """
+        include = None if include is None else tuple(include)
+        exclude = () if exclude is None else tuple(exclude)
+        functions = self.__modules.setdefault(module, {})
+        installed = {item: hooked for _, item, hooked in functions.values()}
+        wrappers: typing.Dict[types.FunctionType, typing.Tuple[typing.Callable, _HookedFunction]] = {
+            original: (item, hooked) for original, item, hooked in functions.values()}
+        for name, item in tuple(vars(module).items()):
+            if not isinstance(item, types.FunctionType) or item.__module__ != module.__name__ \
+                    or item in installed or item in self.__functions or name in functions:
+                continue
+            if include is not None and not any(fnmatch.fnmatchcase(name, pattern) for pattern in include):
+                continue
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude):
+                continue
+            if (entry := wrappers.get(item)) is None:
+                # aliases of one function share its wrapper
+                hooked = _HookedFunction(item)
+                entry = wrappers[item] = (self.__hook_function(item.__name__, item, hooked), hooked)
+            setattr(module, name, entry[0])
+            functions[name] = (item, entry[0], entry[1])
+        self.__refresh_enabled()
+        return module
+
+    def unhook_module(self, module: types.ModuleType):
+        """restore the names hook_module rebound and that still hold the wrapper"""
+        if module not in self.__modules:
+            raise ValueError(f"module is not hooked: {module}")
+        self.__disabled.discard(module)
+        for name, (original, installed, _) in self.__modules.pop(module).items():
+            if vars(module).get(name) is installed:
+                setattr(module, name, original)
+        return module
+
+    def __hook(self, cls: typing.Type, lazy: bool):
+        functions: _HookedClassT = {}
+        for name, item in tuple(cls.__dict__.items()):  # type: str, typing.Any
             if isinstance(item, types.FunctionType):
                 fn = item
-            elif isinstance(item, classmethod):
-                fn = item.__func__
-            elif isinstance(item, staticmethod):
+            elif isinstance(item, (classmethod, staticmethod)):
                 fn = item.__func__
             else:
                 continue
-            fn = self.__hook_function(name, fn)
-            if isinstance(item, types.FunctionType):
-                setattr(cls, name, fn)
-            elif isinstance(item, classmethod):
-                setattr(cls, name, classmethod(fn))
-            elif isinstance(item, staticmethod):
-                setattr(cls, name, staticmethod(fn))
-
-    def __hook_function(self, name: str, fn: types.FunctionType):
-        random_prefix = str(int(time.time()))
+            hooked = _HookedFunction(fn)
+            installed = _LazyMethod(self.__materialize, cls, name) if lazy else self.__wrap(name, item, hooked)
+            setattr(cls, name, installed)
+            functions[name] = (item, installed, hooked)
+        return functions
+
+    def __wrap(self, name: str, item: typing.Any, hooked: _HookedFunction):
+        fn = self.__hook_function(name, hooked.fn, hooked)
+        if isinstance(item, classmethod):
+            return classmethod(fn)
+        elif isinstance(item, staticmethod):
+            return staticmethod(fn)
+        return fn
+
+    def __materialize(self, cls: typing.Type, name: str):
+        with self.__resolve_lock:
+            try:
+                original, installed, hooked = self.__hooked[cls][name]
+            except KeyError:
+                return cls.__dict__[name]  # unhooked (or replaced) after the lookup started
+            if isinstance(installed, _LazyMethod):
+                item = self.__wrap(name, original, hooked)
+                if cls.__dict__.get(name) is installed:
+                    setattr(cls, name, item)
+                self.__hooked[cls][name] = (original, item, hooked)
+                installed = item
+            return installed
+
+    def __hook_function(self, name: str, fn: types.FunctionType, hooked: _HookedFunction):
         sig = Signature(fn)
-        args, args_type, args_default = sig.statement_with_type()
-        args_call = sig.call_statement()
+        kind = self.__function_kind(fn)
+        p = _PREFIX
+        checks, check_globals = (), {}
+        if self.__validate:
+            try:
+                hints = typing.get_type_hints(fn)
+            except Exception:  # unresolvable string annotations, those parameters are not checked
+                hints = None
+            checks, check_globals = sig.check_statement(hints, lambda n: f"{p}_check_{n}", lambda n: f"{p}_{n}")
+            if hints is None:
+                hints = {par.name: par.annotation for par in sig.parameters}
+            check_globals[f"{p}_invalid"] = functools.partial(self.__invalid_argument, fn, hints)
+            check_globals.update({f"{p}_{n.__name__}": n for n in (isinstance, len, all, callable, tuple)})
+        # the wrapper source only depends on the function kind, on each parameter's name, kind and default presence
+        # and on the structure of the checks
+        shape = (kind, sig.shape, checks)
+        if (code := _wrapper_codes.get(shape)) is None:
+            code = _wrapper_codes.setdefault(
+                shape, compile(self.__wrapper_source(kind, sig, checks), f"<hook wrapper: {kind}>", "exec"))
         ln = {}
-        exec(f"def {name}({', '.join(args)}):\n"
-             f"    _{random_prefix}_bind = _{random_prefix}_signature.bind({', '.join(args_call)})\n"
-             f"    _{random_prefix}_bind.apply_defaults()\n"
-             f"    _{random_prefix}_checkpoints = _{random_prefix}_init(_{random_prefix}_{name})\n"
-             f"    _{random_prefix}_before(_{random_prefix}_checkpoints,"
-             f"_{random_prefix}_bind.args, _{random_prefix}_bind.kwargs)\n"
-             f"    try:\n"
-             f"        _{random_prefix}_result = _{random_prefix}_{name}({', '.join(args_call)})\n"
-             f"    except Exception as _{random_prefix}_exception:\n"
-             f"        _{random_prefix}_exception(_{random_prefix}_exception)\n"
-             f"    else:\n"
-             f"        _{random_prefix}_after(_{random_prefix}_checkpoints, _{random_prefix}_result)",
+        exec(code,
              {
-                 f"_{random_prefix}_{name}": fn,
-                 f"_{random_prefix}_signature": sig.signature,
-                 f"_{random_prefix}_init": self.__init_call,
-                 f"_{random_prefix}_before": self.__before_call,
-                 f"_{random_prefix}_after": self.__after_call,
-                 f"_{random_prefix}_exception": self.__exception_call,
-                 **args_type,
-                 **args_default,
+                 **check_globals,
+                 f"{p}_fn": fn,
+                 f"{p}_hooked": hooked,
+                 f"{p}_init": self.__init_call,
+                 f"{p}_before": self.__before_call,
+                 f"{p}_around": self.__around_call,
+                 f"{p}_after": self.__after_call,
+                 f"{p}_exception": self.__exception_call,
+                 f"{p}_time": self.__time_call,
+                 f"{p}_clock": time.perf_counter_ns,
+                 f"{p}_kwargs": types.MappingProxyType,
+                 f"{p}_no_kwargs": _NO_KWARGS,
+                 **sig.type_dict(),
+                 **sig.default_dict(),
              }, ln)
-        return ln[name]
+        wrapper = functools.update_wrapper(ln[f"{p}_wrapper"], fn)
+        wrapper.__name__ = name
+        # functions of one shape share the compiled module, the copy of the code object names the frames after fn
+        # for profilers and tracebacks
+        code = wrapper.__code__
+        wrapper.__code__ = code.replace(co_name=name, co_qualname=fn.__qualname__) \
+            if hasattr(code, "co_qualname") else code.replace(co_name=name)
+        return wrapper
+
+    @staticmethod
+    def __invalid_argument(fn: types.FunctionType, annotations: typing.Mapping[str, typing.Any], name: str, value):
+        raise TypeError(f"{fn.__qualname__}() argument {name!r} does not match {annotations.get(name)!r}: "
+                        f"{type(value).__name__} {value!r:.64}")
+
+    @staticmethod
+    def __function_kind(fn: types.FunctionType):
+        if inspect.isasyncgenfunction(fn):
+            return "async_generator"
+        elif inspect.iscoroutinefunction(fn):
+            return "coroutine"
+        elif inspect.isgeneratorfunction(fn):
+            return "generator"
+        return "function"
+
+    @classmethod
+    def __wrapper_source(cls, kind: str, sig: Signature, checks: typing.Sequence[typing.Tuple[str, str]]):
+        p = _PREFIX
+        validate = "".join(f"    if not ({check}):\n"
+                           f"        {p}_invalid({name!r}, {name})\n" for name, check in checks)
+        args, _, _ = sig.statement_with_type()
+        pack_args, pack_kwargs = sig.pack_statement()
+        call = f"{p}_fn({', '.join(sig.call_statement())})"
+        # one tuple and one read-only mapping per call, whatever the number of checkpoints
+        kwargs = f"{p}_kwargs({{{', '.join(pack_kwargs)}}})" if pack_kwargs else f"{p}_no_kwargs"
+        packed = f"({''.join(arg + ', ' for arg in pack_args)}), {kwargs}"
+        before = [f"{p}_before({p}_checkpoints, {packed})"]
+        if kind == "async_generator":
+            return cls.__async_generator_source(f"{p}_wrapper", args, p, call, before, validate)
+        elif kind == "generator":
+            return cls.__function_source(f"def {p}_wrapper", args, p, f"(yield from {call})", before, validate)
+        # an AroundCheckpoint may answer the call, the answer is returned (and awaited by callers of coroutines)
+        before = [f"{p}_answer = {p}_around({p}_checkpoints, {packed})",
+                  f"if {p}_answer is not None:",
+                  f"    if {p}_timers:",
+                  f"        {p}_time({p}_timers, {p}_clock() - {p}_start, False)",
+                  f"    return {p}_answer[0]"]
+        if kind == "coroutine":
+            return cls.__function_source(f"async def {p}_wrapper", args, p, f"await {call}", before, validate)
+        return cls.__function_source(f"def {p}_wrapper", args, p, call, before, validate)
+
+    @staticmethod
+    def __function_source(define: str, args: typing.Sequence[str], p: str, call: str, before: typing.Sequence[str],
+                          validate: str):
+        """
+        plain function, coroutine function (call is awaited) and generator function (call is delegated with yield from),
+        checkpoints see the arguments when the body starts and the result when it really finishes,
+        timers get the time from before the first enter to before the first exit
+        """
+        return f"{define}({', '.join(args)}):\n" \
+               f"{validate}" \
+               f"    if not {p}_hooked.enabled:\n" \
+               f"        return {call}\n" \
+               f"    if {p}_hooked.sample is not None and not {p}_hooked.sample():\n" \
+               f"        return {call}\n" \
+               f"    {p}_checkpoints = {p}_init({p}_hooked)\n" \
+               f"    {p}_timers = {p}_hooked.timers\n" \
+               f"    if not {p}_checkpoints and not {p}_timers:\n" \
+               f"        return {call}\n" \
+               f"    {p}_start = {p}_clock() if {p}_timers else 0\n" \
+               f"    if {p}_checkpoints:\n" \
+               f"{''.join(f'        {line}{chr(10)}' for line in before)}" \
+               f"    try:\n" \
+               f"        {p}_result = {call}\n" \
+               f"    except GeneratorExit:\n" \
+               f"        if {p}_timers:\n" \
+               f"            {p}_time({p}_timers, {p}_clock() - {p}_start, False)\n" \
+               f"        {p}_after({p}_checkpoints, None)\n" \
+               f"        raise\n" \
+               f"    except BaseException as {p}_error:\n" \
+               f"        if {p}_timers:\n" \
+               f"            {p}_time({p}_timers, {p}_clock() - {p}_start, True)\n" \
+               f"        {p}_exception({p}_checkpoints, {p}_error)\n" \
+               f"        raise\n" \
+               f"    if {p}_timers:\n" \
+               f"        {p}_time({p}_timers, {p}_clock() - {p}_start, False)\n" \
+               f"    if {p}_checkpoints:\n" \
+               f"        {p}_after({p}_checkpoints, {p}_result)\n" \
+               f"    return {p}_result\n"
+
+    @staticmethod
+    def __async_generator_source(name: str, args: typing.Sequence[str], p: str, call: str,
+                                 before: typing.Sequence[str], validate: str):
+        """
+        async generator function, there is no "yield from" for async generators,
+        so asend/athrow/aclose are forwarded to the wrapped generator by hand
+        """
+        return f"async def {name}({', '.join(args)}):\n" \
+               f"{validate}" \
+               f"    {p}_checkpoints = ()\n" \
+               f"    if {p}_hooked.enabled and ({p}_hooked.sample is None or {p}_hooked.sample()):\n" \
+               f"        {p}_checkpoints = {p}_init({p}_hooked)\n" \
+               f"    {p}_timers = {p}_hooked.timers if {p}_hooked.enabled else ()\n" \
+               f"    {p}_generator = {call}\n" \
+               f"    {p}_start = {p}_clock() if {p}_timers else 0\n" \
+               f"    if {p}_checkpoints:\n" \
+               f"{''.join(f'        {line}{chr(10)}' for line in before)}" \
+               f"    try:\n" \
+               f"        try:\n" \
+               f"            {p}_value = await {p}_generator.__anext__()\n" \
+               f"            while True:\n" \
+               f"                try:\n" \
+               f"                    {p}_sent = yield {p}_value\n" \
+               f"                except GeneratorExit:\n" \
+               f"                    await {p}_generator.aclose()\n" \
+               f"                    raise\n" \
+               f"                except BaseException as {p}_thrown:\n" \
+               f"                    {p}_value = await {p}_generator.athrow({p}_thrown)\n" \
+               f"                else:\n" \
+               f"                    {p}_value = await {p}_generator.asend({p}_sent)\n" \
+               f"        except StopAsyncIteration:\n" \
+               f"            pass\n" \
+               f"    except GeneratorExit:\n" \
+               f"        if {p}_timers:\n" \
+               f"            {p}_time({p}_timers, {p}_clock() - {p}_start, False)\n" \
+               f"        if {p}_checkpoints:\n" \
+               f"            {p}_after({p}_checkpoints, None)\n" \
+               f"        raise\n" \
+               f"    except BaseException as {p}_error:\n" \
+               f"        if {p}_timers:\n" \
+               f"            {p}_time({p}_timers, {p}_clock() - {p}_start, True)\n" \
+               f"        if {p}_checkpoints:\n" \
+               f"            {p}_exception({p}_checkpoints, {p}_error)\n" \
+               f"        raise\n" \
+               f"    if {p}_timers:\n" \
+               f"        {p}_time({p}_timers, {p}_clock() - {p}_start, False)\n" \
+               f"    if {p}_checkpoints:\n" \
+               f"        {p}_after({p}_checkpoints, None)\n"
 
 
 __all__ = [
     "Hook",
     "Checkpoint",
+    "AroundCheckpoint",
+    "CheckpointScope",
+    "AsyncCheckpoint",
+    "BufferedCheckpoint",
+    "CheckpointDispatcher",
+    "DispatchPolicy",
+    "Sampler",
+    "EveryNthSampler",
+    "ProbabilitySampler",
+    "TokenBucketSampler",
 ]
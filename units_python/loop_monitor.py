@@ -0,0 +1,135 @@
+import heapq
+import threading
+import time
+import traceback
+import typing
+import warnings
+
+
+class Stall:
+    """
+    kind:
+        "queue": a posted Qt event waited too long before it was dispatched\n
+        "dispatch": handling one Qt event blocked the Qt thread too long\n
+        "step": one asyncio loop iteration or one trio task step ran too long, culprit names what ran
+    """
+    __slots__ = ("kind", "duration_ns", "culprit", "timestamp")
+
+    def __init__(self, kind: str, duration_ns: int, culprit: typing.Any = None):
+        self.kind = kind
+        self.duration_ns = duration_ns
+        self.culprit = culprit
+        self.timestamp = time.time()
+
+    def __lt__(self, other: "Stall"):
+        return self.duration_ns < other.duration_ns
+
+    def __repr__(self):
+        return f"<Stall {self.kind} {self.duration_ns / 1e6:.3f}ms {self.culprit!r}>"
+
+
+class LoopMonitor:
+    """
+    lag and starvation statistics of a Qt bridge (QtAsyncio, QtEventLoop, TrioQt)\n
+    every dispatch/step is counted, only those over threshold create a Stall, reported to on_stall
+    and kept if they are among the longest ones
+    """
+
+    def __init__(self,
+                 threshold: float = .05,
+                 on_stall: typing.Optional[typing.Callable[[Stall], typing.Any]] = None,
+                 keep: int = 16):
+        """
+        :param threshold: 超过该时长 (秒) 视为卡顿
+        :param on_stall: 卡顿回调, 在 Qt 线程中同步执行
+        :param keep: 保留的最长卡顿数量
+        """
+        self.__threshold_ns = int(threshold * 1e9)
+        self.__on_stall = on_stall
+        self.__keep = keep
+        self.__lock = threading.Lock()
+        self.reset()
+
+    @property
+    def threshold_ns(self):
+        return self.__threshold_ns
+
+    def reset(self):
+        self.__dispatches = 0
+        self.__queue_total_ns = 0
+        self.__queue_max_ns = 0
+        self.__dispatch_total_ns = 0
+        self.__dispatch_max_ns = 0
+        self.__steps = 0
+        self.__step_total_ns = 0
+        self.__step_max_ns = 0
+        self.__stall_count = 0
+        self.__stalls: typing.List[Stall] = []  # min heap of the longest stalls
+
+    def record_dispatch(self, queued_ns: int, run_ns: int):
+        """
+        :param queued_ns: Qt 事件从投递到开始处理的时长
+        :param run_ns: 处理该事件占用 Qt 线程的时长
+        """
+        self.__dispatches += 1
+        self.__queue_total_ns += queued_ns
+        self.__dispatch_total_ns += run_ns
+        if queued_ns > self.__queue_max_ns:
+            self.__queue_max_ns = queued_ns
+        if run_ns > self.__dispatch_max_ns:
+            self.__dispatch_max_ns = run_ns
+        if queued_ns >= self.__threshold_ns:
+            self.__stall(Stall("queue", queued_ns))
+        if run_ns >= self.__threshold_ns:
+            self.__stall(Stall("dispatch", run_ns))
+
+    def record_step(self, run_ns: int, culprit: typing.Any = None):
+        """
+        :param run_ns: 一次 asyncio 迭代/trio task step 的时长
+        :param culprit: 本次运行的 task/callback
+        """
+        self.__steps += 1
+        self.__step_total_ns += run_ns
+        if run_ns > self.__step_max_ns:
+            self.__step_max_ns = run_ns
+        if run_ns >= self.__threshold_ns:
+            self.__stall(Stall("step", run_ns, culprit))
+
+    @property
+    def stalls(self):
+        """longest stalls, longest first"""
+        with self.__lock:
+            return sorted(self.__stalls, reverse=True)
+
+    def snapshot(self):
+        return {
+            "dispatches": self.__dispatches,
+            "queue_mean_ns": self.__queue_total_ns // self.__dispatches if self.__dispatches else 0,
+            "queue_max_ns": self.__queue_max_ns,
+            "dispatch_mean_ns": self.__dispatch_total_ns // self.__dispatches if self.__dispatches else 0,
+            "dispatch_max_ns": self.__dispatch_max_ns,
+            "steps": self.__steps,
+            "step_mean_ns": self.__step_total_ns // self.__steps if self.__steps else 0,
+            "step_max_ns": self.__step_max_ns,
+            "stalls": self.__stall_count,
+        }
+
+    def __stall(self, stall: Stall):
+        self.__stall_count += 1
+        with self.__lock:
+            if len(self.__stalls) < self.__keep:
+                heapq.heappush(self.__stalls, stall)
+            elif self.__keep > 0 and self.__stalls[0] < stall:
+                heapq.heapreplace(self.__stalls, stall)
+        if self.__on_stall is not None:
+            try:
+                self.__on_stall(stall)
+            except Exception as e:
+                warnings.warn(f"stall callback error: {self.__on_stall}")
+                traceback.print_exception(type(e), e, e.__traceback__)
+
+
+__all__ = [
+    "Stall",
+    "LoopMonitor",
+]
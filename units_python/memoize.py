@@ -0,0 +1,225 @@
+import collections
+import inspect
+import threading
+import time
+import types
+import typing
+
+from .function_hook import AroundCheckpoint, CheckpointScope, Hook
+
+_KeyT = typing.Hashable
+_KWARGS_MARK = (object(),)  # separates positional from keyword arguments in a key, like functools._make_key
+
+
+class MemoStats:
+    __slots__ = ("name", "hits", "misses", "waits", "evictions", "expirations", "unhashable")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0  # calls answered by a concurrent identical call
+        self.evictions = 0
+        self.expirations = 0
+        self.unhashable = 0  # calls whose arguments can't be a cache key, they always run
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "unhashable": self.unhashable,
+        }
+
+
+class _Flight:
+    """the call computing a key, identical calls wait for it instead of running again"""
+    __slots__ = ("thread", "done", "ok", "value")
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+class MemoCache:
+    """LRU cache of one hooked function, with optional TTL and single-flight"""
+
+    def __init__(self, name: str, maxsize: int, ttl: typing.Optional[float]):
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__entries: "collections.OrderedDict[_KeyT, typing.Tuple[typing.Any, float]]" = collections.OrderedDict()
+        self.__flights: typing.Dict[_KeyT, _Flight] = {}
+        # reentrant, a checkpoint released by the garbage collector may finish its flight while the lock is held
+        self.__lock = threading.RLock()
+        self.stats = MemoStats(name)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def lookup(self, key: _KeyT) -> typing.Tuple[typing.Optional[typing.Tuple[typing.Any]], typing.Optional[_Flight]]:
+        """
+        :return: ((缓存值,), None) 命中, (None, flight) 本次调用负责计算, (None, None) 直接运行
+        """
+        stats = self.stats
+        with self.__lock:
+            if (entry := self.__entries.get(key)) is not None:
+                if entry[1] >= time.monotonic():
+                    self.__entries.move_to_end(key)
+                    stats.hits += 1
+                    return (entry[0],), None
+                del self.__entries[key]
+                stats.expirations += 1
+            if (flight := self.__flights.get(key)) is None:
+                stats.misses += 1
+                flight = self.__flights[key] = _Flight()
+                return None, flight
+        if flight.thread == threading.get_ident():
+            # a recursive identical call would wait for itself
+            stats.misses += 1
+            return None, None
+        flight.done.wait()
+        if flight.ok:
+            stats.waits += 1
+            return (flight.value,), None
+        stats.misses += 1
+        return None, None
+
+    def finish(self, key: _KeyT, flight: _Flight, ok: bool, value: typing.Any = None):
+        with self.__lock:
+            if ok and self.__maxsize > 0:
+                expires = float("inf") if self.__ttl is None else time.monotonic() + self.__ttl
+                self.__entries[key] = (value, expires)
+                self.__entries.move_to_end(key)
+                if len(self.__entries) > self.__maxsize:
+                    self.__entries.popitem(last=False)
+                    self.stats.evictions += 1
+            del self.__flights[key]
+        flight.ok = ok
+        flight.value = value
+        flight.done.set()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+class MemoizeCheckpoint(AroundCheckpoint):
+    """
+    per call checkpoint (CheckpointScope.CALL), the key is the arguments as packed by the wrapper\n
+    a call ending without exit or exception releases its flight when the checkpoint is dropped,
+    so identical calls waiting for it run themselves instead of blocking forever
+    """
+
+    def __init__(self, cache: MemoCache):
+        self.__cache = cache
+        self.__key: _KeyT = None
+        self.__flight: typing.Optional[_Flight] = None
+
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        key = args + _KWARGS_MARK + tuple(kwargs.items()) if kwargs else args
+        try:
+            hash(key)
+        except TypeError:
+            self.__cache.stats.unhashable += 1
+            return None
+        answer, self.__flight = self.__cache.lookup(key)
+        self.__key = key
+        return answer
+
+    def exit(self, result: typing.Any):
+        self.__finish(True, result)
+
+    def exception(self, exc: BaseException):
+        self.__finish(False)
+
+    def __del__(self):
+        self.__finish(False)
+
+    def __finish(self, ok: bool, value: typing.Any = None):
+        flight, self.__flight = self.__flight, None
+        if flight is not None:
+            self.__cache.finish(self.__key, flight, ok, value)
+
+
+class Memoizer:
+    """
+    cache the results of hooked plain functions without editing them,
+    coroutine and generator functions are not cached\n
+    example:
+        memoizer = Memoizer(maxsize=256, ttl=60, include=lambda fn: fn.__name__.startswith("load_"))
+        memoizer.install(hook)
+    """
+
+    def __init__(self,
+                 maxsize: int = 128,
+                 ttl: typing.Optional[float] = None,
+                 include: typing.Optional[typing.Callable[[types.FunctionType], bool]] = None):
+        """
+        :param maxsize: 每个函数最多缓存的结果数量
+        :param ttl: 结果的有效时长 (秒), None 表示不过期
+        :param include: 返回 True 的函数才会被缓存, None 表示全部
+        """
+        if maxsize < 0 or (ttl is not None and ttl < 0):
+            raise ValueError(f"negative memoize limits: {maxsize}, {ttl}")
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__include = include
+        self.__caches: typing.Dict[types.FunctionType, typing.Optional[MemoCache]] = {}
+        self.__lock = threading.Lock()
+
+    def install(self, hook: Hook):
+        hook.add_checkpoint(self.checkpoint, CheckpointScope.CALL)
+        return self
+
+    def checkpoint(self, fn: types.FunctionType):
+        """checkpoint factory for Hook.add_checkpoint(..., CheckpointScope.CALL)"""
+        try:
+            cache = self.__caches[fn]
+        except KeyError:
+            cache = self.cache(fn)
+        return None if cache is None else MemoizeCheckpoint(cache)
+
+    def cache(self, fn: types.FunctionType) -> typing.Optional[MemoCache]:
+        """
+        :return: fn 的缓存, 不缓存的函数返回 None
+        """
+        with self.__lock:
+            if fn not in self.__caches:
+                # functions that are not cached are remembered as None, the factory runs on every call
+                if inspect.iscoroutinefunction(fn) or inspect.isgeneratorfunction(fn) \
+                        or inspect.isasyncgenfunction(fn) or (self.__include is not None and not self.__include(fn)):
+                    self.__caches[fn] = None
+                else:
+                    self.__caches[fn] = MemoCache(f"{fn.__module__}.{fn.__qualname__}", self.__maxsize, self.__ttl)
+            return self.__caches[fn]
+
+    def clear(self):
+        for cache in tuple(self.__caches.values()):
+            if cache is not None:
+                cache.clear()
+
+    def snapshot(self):
+        result = []
+        for cache in tuple(self.__caches.values()):
+            if cache is None:
+                continue
+            stats = cache.stats.snapshot()
+            stats["size"] = len(cache)
+            result.append(stats)
+        return result
+
+
+__all__ = [
+    "MemoStats",
+    "MemoCache",
+    "MemoizeCheckpoint",
+    "Memoizer",
+]
@@ -0,0 +1,123 @@
+import concurrent.futures
+import itertools
+import threading
+import typing
+
+from PySide2.QtCore import QCoreApplication, QEvent, QObject
+
+OffloadEventType = QEvent.Type(QEvent.registerEventType())  # noqa
+ProgressCallback = typing.Callable[[int, int], typing.Any]
+
+
+class OffloadEvent(QEvent):
+    def __init__(self, callback: typing.Callable):
+        super().__init__(OffloadEventType)
+        self.__callback = callback
+
+    @property
+    def callback(self):
+        return self.__callback
+
+
+class OffloadObject(QObject):
+    def event(self, event):
+        if isinstance(event, OffloadEvent):
+            event.callback()
+            return True
+        return False
+
+
+def _run_chunk(fn: typing.Callable, chunk: typing.Sequence):
+    """module level so process pools can pickle it"""
+    return [fn(item) for item in chunk]
+
+
+class Offload:
+    """
+    run callables in a thread or process pool, so cpu heavy work never blocks the Qt thread\n
+    results go back through the bridge's loop (AsyncioOffload, TrioOffload), progress callbacks through Qt events\n
+    cancelling the awaiting task cancels the chunks that have not started, running ones finish and are dropped\n
+    create it in the Qt thread
+    """
+
+    def __init__(self,
+                 executor: typing.Optional[concurrent.futures.Executor] = None,
+                 processes: bool = False,
+                 max_workers: typing.Optional[int] = None):
+        """
+        :param executor: 使用已有的 executor, 由调用者负责关闭
+        :param processes: executor 为 None 时创建 ProcessPoolExecutor, 否则创建 ThreadPoolExecutor
+        :param max_workers: 创建的 executor 的最大 worker 数量
+        """
+        if executor is None:
+            pool = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+            executor = pool(max_workers)
+            self.__owned = True
+        else:
+            self.__owned = False
+        self.__executor = executor
+        self.__offload_object = OffloadObject()
+
+    @property
+    def executor(self):
+        return self.__executor
+
+    def submit(self, fn: typing.Callable, *args, **kwargs) -> concurrent.futures.Future:
+        return self.__executor.submit(fn, *args, **kwargs)
+
+    def submit_chunks(self,
+                      fn: typing.Callable,
+                      iterable: typing.Iterable,
+                      chunksize: int = 1,
+                      progress: typing.Optional[ProgressCallback] = None) -> typing.List[concurrent.futures.Future]:
+        """
+        :param fn: 对每个元素调用的函数, 使用进程池时必须可以 pickle
+        :param chunksize: 每个任务处理的元素数量
+        :param progress: progress(已完成元素数, 元素总数), 在 Qt 线程中调用
+        :return: 每个分块的 future, 结果为该分块的结果列表
+        """
+        if chunksize < 1:
+            raise ValueError(f"chunksize must be positive: {chunksize}")
+        iterator = iter(iterable)
+        chunks = []
+        while chunk := list(itertools.islice(iterator, chunksize)):
+            chunks.append(chunk)
+        total = sum(len(chunk) for chunk in chunks)
+        futures = [self.__executor.submit(_run_chunk, fn, chunk) for chunk in chunks]
+        if progress is not None:
+            lock = threading.Lock()
+            done = [0]
+
+            def _chunk_done(size: int, future: concurrent.futures.Future):
+                if future.cancelled() or future.exception() is not None:
+                    return
+                with lock:
+                    done[0] += size
+                    count = done[0]
+                self.post(lambda: progress(count, total))
+
+            for chunk, future in zip(chunks, futures):
+                future.add_done_callback(lambda f, size=len(chunk): _chunk_done(size, f))
+        return futures
+
+    def post(self, callback: typing.Callable):
+        """run callback in the Qt thread, thread safe"""
+        QCoreApplication.postEvent(self.__offload_object, OffloadEvent(callback))
+
+    def shutdown(self, wait: bool = True):
+        """only shuts down executors created by this Offload"""
+        if self.__owned:
+            self.__executor.shutdown(wait, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+__all__ = [
+    "Offload",
+    "OffloadEvent",
+    "OffloadObject",
+]
@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+import types
+import typing
+
+from .function_hook import Checkpoint, Hook, Sampler
+
+HISTOGRAM_BUCKETS = 64  # bucket i counts latencies in [2 ** (i - 1), 2 ** i) ns
+_NO_CALL_NS = 1 << HISTOGRAM_BUCKETS  # min_ns before the first call
+
+
+class FunctionProfile:
+    """
+    latency statistics of one hooked function, all storage is allocated up front\n
+    updates are not locked, concurrent threads may very rarely lose an update
+    """
+    __slots__ = ("name", "calls", "exceptions", "total_ns", "min_ns", "max_ns", "buckets")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.exceptions = 0
+        self.total_ns = 0
+        self.min_ns = _NO_CALL_NS
+        self.max_ns = 0
+        buckets = self.buckets
+        for i in range(HISTOGRAM_BUCKETS):
+            buckets[i] = 0
+
+    def record(self, elapsed_ns: int, failed: bool = False):
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns < self.min_ns:
+            self.min_ns = elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        if failed:
+            self.exceptions += 1
+        bucket = elapsed_ns.bit_length()
+        self.buckets[bucket if bucket < HISTOGRAM_BUCKETS else HISTOGRAM_BUCKETS - 1] += 1
+
+    def percentile(self, q: float):
+        """
+        :param q: 0 ~ 1
+        :return: upper bound (ns) of the bucket holding the q-th latency
+        """
+        if self.calls == 0:
+            return 0
+        rank = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << i, self.max_ns)
+        return self.max_ns
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "exceptions": self.exceptions,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns // self.calls if self.calls else 0,
+            "min_ns": self.min_ns if self.calls else 0,
+            "max_ns": self.max_ns,
+            "p50_ns": self.percentile(.5),
+            "p99_ns": self.percentile(.99),
+            "buckets": list(self.buckets),
+        }
+
+
+def format_table(rows: typing.Iterable[typing.Dict[str, typing.Any]],
+                 sort: str = "total_ns",
+                 limit: typing.Optional[int] = None):
+    """
+    :param rows: FunctionProfile.snapshot 格式的数据
+    :param sort: 用于降序排序的字段
+    :param limit: 最多输出的行数
+    :return: 文本表格
+    """
+    rows = sorted(rows, key=lambda item: item[sort], reverse=True)[:limit]
+    header = f"{'function':<48}{'calls':>10}{'errors':>8}{'total ms':>12}" \
+             f"{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'max us':>10}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{row['name']:<48}{row['calls']:>10}{row['exceptions']:>8}"
+                     f"{row['total_ns'] / 1e6:>12.3f}{row['mean_ns'] / 1e3:>10.2f}"
+                     f"{row['p50_ns'] / 1e3:>10.2f}{row['p99_ns'] / 1e3:>10.2f}{row['max_ns'] / 1e3:>10.2f}")
+    return "\n".join(lines)
+
+
+class ProfilingCheckpoint(Checkpoint):
+    """
+    per call checkpoint (CheckpointScope.CALL) recording into a shared FunctionProfile,
+    for hooks used with checkpoints only, Profiler.install uses the cheaper Hook.add_timer
+    """
+
+    def __init__(self, profile: FunctionProfile):
+        self.__profile = profile
+        self.__start = 0
+
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        self.__start = time.perf_counter_ns()
+
+    def exit(self, result: typing.Union[None, typing.Tuple[typing.Any]]):
+        self.__profile.record(time.perf_counter_ns() - self.__start)
+
+    def exception(self, exc: BaseException):
+        self.__profile.record(time.perf_counter_ns() - self.__start, True)
+
+
+class Profiler:
+    """
+    example:
+        profiler = Profiler()
+        profiler.install(hook)
+        ...
+        print(profiler.table())
+    """
+
+    def __init__(self):
+        self.__profiles: typing.Dict[types.FunctionType, FunctionProfile] = {}
+        self.__lock = threading.Lock()
+
+    def install(self, hook: Hook, sampler: typing.Optional[Sampler] = None):
+        hook.add_timer(self.timer, sampler)
+        return self
+
+    def timer(self, fn: types.FunctionType):
+        """timer factory for Hook.add_timer"""
+        return self.profile(fn).record
+
+    def checkpoint(self, fn: types.FunctionType):
+        """checkpoint factory for Hook.add_checkpoint(..., CheckpointScope.CALL)"""
+        return ProfilingCheckpoint(self.profile(fn))
+
+    def profile(self, fn: types.FunctionType):
+        with self.__lock:
+            if (profile := self.__profiles.get(fn)) is None:
+                profile = self.__profiles[fn] = FunctionProfile(f"{fn.__module__}.{fn.__qualname__}")
+        return profile
+
+    def reset(self):
+        for profile in tuple(self.__profiles.values()):
+            profile.reset()
+
+    def snapshot(self, reset: bool = False):
+        """
+        :param reset: 读取后清零
+        :return: 被调用过的函数的统计数据
+        """
+        result = []
+        for profile in tuple(self.__profiles.values()):
+            if profile.calls == 0:
+                continue
+            result.append(profile.snapshot())
+            if reset:
+                profile.reset()
+        return result
+
+    def table(self, sort: str = "total_ns", limit: typing.Optional[int] = None):
+        """
+        :param sort: snapshot 中用于降序排序的字段
+        :param limit: 最多输出的行数
+        :return: 文本表格
+        """
+        return format_table(self.snapshot(), sort, limit)
+
+    def to_json(self, sort: str = "total_ns", **kwargs):
+        """
+        :param sort: snapshot 中用于降序排序的字段
+        :param kwargs: json.dumps 的参数
+        """
+        return json.dumps(sorted(self.snapshot(), key=lambda item: item[sort], reverse=True), **kwargs)
+
+
+__all__ = [
+    "format_table",
+    "FunctionProfile",
+    "ProfilingCheckpoint",
+    "Profiler",
+]
@@ -3,11 +3,25 @@ Example: https://doc.qt.io/qtforpython-6/examples/example_async_minimal.html
 """
 
 import asyncio
+import concurrent.futures
+import contextlib
+import math
+import selectors
+import sys
+import threading
+import time
 import typing
+import weakref
 
-from PySide2.QtCore import QEvent, QObject, QCoreApplication
+from PySide2.QtCore import QEvent, QEventLoop, QObject, QCoreApplication, QSocketNotifier, QTimer, Qt, SignalInstance
+
+from .bridge_thread import BridgeThread
+from .loop_monitor import LoopMonitor
+from .offload import Offload, ProgressCallback
+from .signal_stream import SignalStream, SignalStreamClosed, StreamPolicy
 
 AsyncEventType = QEvent.Type(QEvent.Type.User + 1)  # noqa
+_POLL_INTERVAL_MS = 10  # loops without a selector (proactor) can't be watched, poll them while tasks are alive
 
 
 class QtAsyncioEvent(QEvent):
@@ -28,38 +42,600 @@ class QtAsyncioObject(QObject):
         return False
 
 
-class QtAsyncio:
-    def __init__(self, loop: asyncio.AbstractEventLoop):
+class SchedulePolicy:
+    """
+    how long one QtAsyncioEvent may keep running loop iterations before control goes back to Qt\n
+    a batch ends when the ready queue drains, the budget elapses or max_iterations is reached,
+    adaptive policies also end it once min_budget has been used if Qt looked busy when the batch started,
+    halving the budget (down to min_budget), and double it again (up to budget) after batches that were not interrupted\n
+    Qt has no supported way to peek at its pending events (QAbstractEventDispatcher.hasPendingEvents is obsolete),
+    busy means the batch's own QtAsyncioEvent waited at least min_budget in Qt's queue,
+    so a burst of Qt events arriving during a batch is only seen by the next one
+    """
+
+    def __init__(self,
+                 budget: float = .004,
+                 max_iterations: int = 0,
+                 adaptive: bool = False,
+                 min_budget: float = .0005):
+        """
+        :param budget: 每批最多运行的时间 (秒), 0 表示每个事件只运行一次迭代
+        :param max_iterations: 每批最多运行的迭代次数, 0 表示不限制
+        :param adaptive: Qt 繁忙 (本批事件排队超过 min_budget) 时缩减预算
+        :param min_budget: 自适应时预算的下限 (秒)
+        """
+        if budget < 0 or max_iterations < 0 or min_budget < 0:
+            raise ValueError(f"negative schedule policy: {budget}, {max_iterations}, {min_budget}")
+        self.__budget = budget
+        self.__max_iterations = max_iterations
+        self.__adaptive = adaptive
+        self.__min_budget = min(min_budget, budget)
+        self.__current = budget
+
+    @classmethod
+    def single(cls):
+        """one loop iteration per Qt event"""
+        return cls(budget=0, max_iterations=1)
+
+    @property
+    def budget(self):
+        """budget of the next batch"""
+        return self.__current
+
+    @property
+    def min_budget(self):
+        return self.__min_budget
+
+    @property
+    def max_iterations(self):
+        return self.__max_iterations
+
+    @property
+    def adaptive(self):
+        return self.__adaptive
+
+    def interrupted(self, queued: float) -> bool:
+        """
+        :param queued: 本批 QtAsyncioEvent 从 post 到开始处理等待的时间 (秒)
+        :return: whether the batch should give way to Qt once min_budget has been used
+        """
+        return self.__adaptive and queued >= self.__min_budget
+
+    def feedback(self, interrupted: bool):
+        if not self.__adaptive:
+            return
+        if interrupted:
+            self.__current = max(self.__min_budget, self.__current / 2)
+        else:
+            self.__current = min(self.__budget, self.__current * 2)
+
+
+class _QtLoopDriver:
+    """
+    the Qt side shared by QtAsyncio and QtEventLoop\n
+    after every batch the driver looks at what the loop waits for:
+    ready callbacks post one QtAsyncioEvent, the nearest timer arms a single shot QTimer,
+    and every fd registered in the loop's selector gets a QSocketNotifier, with nothing runnable Qt stays idle
+    """
+
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 policy: SchedulePolicy,
+                 run: typing.Callable[[], None],
+                 stop: typing.Callable[[], None],
+                 monitor: typing.Optional[LoopMonitor] = None):
+        """
+        :param run: 运行 loop 直到 stop 被调用
+        :param stop: 结束当前批次
+        :param monitor: 记录事件排队延迟, 批次/迭代耗时
+        """
         self.__loop = loop
+        self.__policy = policy
+        self.__monitor = monitor
+        self.__posted_ns = 0
+        self.__step_ns = 0
+        self.__step_handles: typing.Tuple[asyncio.Handle, ...] = ()
+        self.__run = run
+        self.__stop = stop
+        self.__batching = False
+        self.__deadline = 0.
+        self.__floor = 0.
+        self.__iterations = 0
+        self.__busy = False
+        self.__interrupted = False
         self.__async_object = QtAsyncioObject()
-        self.__sem = 0
+        self.__posted = False
+        self.__timer = QTimer(self.__async_object)
+        self.__timer.setSingleShot(True)
+        self.__timer.setTimerType(Qt.PreciseTimer)
+        self.__timer.timeout.connect(self.wakeup)  # noqa
+        self.__notifiers: typing.Dict[typing.Tuple[int, QSocketNotifier.Type], QSocketNotifier] = {}
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def batching(self):
+        return self.__batching
+
+    @property
+    def monitor(self):
+        return self.__monitor
+
+    def wakeup(self):
+        if self.__posted:
+            return
+        self.__posted = True
+        self.__posted_ns = time.perf_counter_ns()
+        QCoreApplication.postEvent(self.__async_object, QtAsyncioEvent(self.continue_loop))
+
+    def continue_loop(self):
+        self.__posted = False
+        if self.__loop.is_closed():
+            return self.close()
+        now = time.perf_counter()
+        self.__deadline = now + self.__policy.budget
+        self.__floor = now + self.__policy.min_budget
+        self.__iterations = 0
+        self.__busy = self.__policy.interrupted((time.perf_counter_ns() - self.__posted_ns) / 1e9)
+        self.__interrupted = False
+        self.__batching = True
+        self.__loop.call_soon(self.__batch)
+        started_ns = time.perf_counter_ns()
+        if (monitor := self.__monitor) is not None:
+            self.__step_ns = started_ns
+            self.__step_handles = tuple(getattr(self.__loop, "_ready", ()))
+        try:
+            self.__run()  # the select never blocks, __batch is always ready until the batch ends
+        finally:
+            self.__batching = False
+        if monitor is not None:
+            monitor.record_dispatch(started_ns - self.__posted_ns, time.perf_counter_ns() - started_ns)
+        self.__policy.feedback(self.__interrupted)
+        self.schedule()
+
+    def __batch(self):
+        """runs once per loop iteration, keeps the batch going while the policy allows it"""
+        loop = self.__loop
+        policy = self.__policy
+        self.__iterations += 1
+        if self.__monitor is not None:
+            self.__record_step()
+        now = time.perf_counter()
+        if not getattr(loop, "_ready", None) \
+                or 0 < policy.max_iterations <= self.__iterations \
+                or now >= self.__deadline:
+            self.__batching = False
+            self.__stop()
+        elif now >= self.__floor and self.__busy:
+            self.__interrupted = True
+            self.__batching = False
+            self.__stop()
+        else:
+            loop.call_soon(self.__batch)
+        if self.__monitor is not None:
+            self.__step_handles = tuple(getattr(loop, "_ready", ()))
+
+    def __record_step(self):
+        """a step spans __batch to __batch, it ran the handles that were ready when the previous step ended"""
+        now_ns = time.perf_counter_ns()
+        run_ns = now_ns - self.__step_ns
+        culprit = None
+        if run_ns >= self.__monitor.threshold_ns:
+            culprit = []
+            for handle in self.__step_handles:
+                callback = getattr(handle, "_callback", handle)
+                if callback == self.__batch:
+                    continue
+                owner = getattr(callback, "__self__", None)
+                culprit.append(owner if isinstance(owner, asyncio.Task) else callback)
+            culprit = tuple(culprit)
+        self.__monitor.record_step(run_ns, culprit)
+        self.__step_ns = now_ns
+
+    def end_batch(self):
+        """end the running batch after the current loop iteration"""
+        self.__batching = False
+
+    def schedule(self):
+        loop = self.__loop
+        if loop.is_closed():
+            return self.close()
+        if getattr(loop, "_ready", None):
+            self.wakeup()
+            return
+        selector = getattr(loop, "_selector", None)
+        if selector is None:
+            if asyncio.all_tasks(loop):
+                self.__timer.start(_POLL_INTERVAL_MS)
+            return
+        self.__watch({fd: key.events for fd, key in selector.get_map().items()})
+        scheduled = getattr(loop, "_scheduled", None)
+        if scheduled:
+            self.__timer.start(max(0, math.ceil((scheduled[0].when() - loop.time()) * 1000)))
+        else:
+            self.__timer.stop()
+
+    def close(self):
+        self.__timer.stop()
+        self.__watch({})
+
+    def __watch(self, fds: typing.Mapping[int, int]):
+        wanted = set()
+        for fd, events in fds.items():
+            if events & selectors.EVENT_READ:
+                wanted.add((fd, QSocketNotifier.Read))
+            if events & selectors.EVENT_WRITE:
+                wanted.add((fd, QSocketNotifier.Write))
+        for key in tuple(self.__notifiers):
+            if key not in wanted:
+                notifier = self.__notifiers.pop(key)
+                notifier.setEnabled(False)
+                notifier.deleteLater()
+        for key in wanted:
+            if (notifier := self.__notifiers.get(key)) is None:
+                notifier = self.__notifiers[key] = QSocketNotifier(key[0], key[1], self.__async_object)
+                notifier.activated.connect(self.__activated)  # noqa
+            notifier.setEnabled(True)
+
+    def __activated(self, *_):
+        # level triggered, keep quiet until the loop had a chance to consume the fd
+        for notifier in self.__notifiers.values():
+            notifier.setEnabled(False)
+        self.wakeup()
+
+
+class QtAsyncio:
+    """
+    drive an existing asyncio loop from the Qt event loop,
+    each QtAsyncioEvent runs a batch of iterations bounded by the SchedulePolicy\n
+    a QtEventLoop drives itself, QtAsyncio only forwards create_task to it
+    """
+
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 policy: typing.Optional[SchedulePolicy] = None,
+                 monitor: typing.Optional[LoopMonitor] = None):
+        self.__loop = loop
+        if isinstance(loop, QtEventLoop):
+            self.__policy = loop.policy
+            self.__monitor = loop.monitor
+            self.__driver = None
+        else:
+            self.__policy = SchedulePolicy() if policy is None else policy
+            self.__monitor = monitor
+            self.__driver = _QtLoopDriver(loop, self.__policy, loop.run_forever, loop.stop, monitor)
+            # Qt slots resolving futures or calling call_soon/call_later between batches must wake the idle loop,
+            # like QtEventLoop does in its overrides
+            for name in ("call_soon", "call_at"):
+                setattr(loop, name, self.__notifying(getattr(loop, name)))
+            # watch the self-pipe from the start, so submit wakes an idle loop
+            self.__driver.schedule()
 
     def create_task(self, async_fn: typing.Coroutine):
-        self.__sem += 1
-        task = self.__loop.create_task(self.__run_async_fn(async_fn))
-        self.__next_guest_run_schedule()
+        """only from the thread the QtAsyncio was created in, submit from any other"""
+        task = self.__loop.create_task(async_fn)
+        if self.__driver is not None:
+            self.__driver.wakeup()
         return task
 
-    async def __run_async_fn(self, async_fn: typing.Coroutine):
+    def submit(self, async_fn: typing.Coroutine) -> concurrent.futures.Future:
+        """thread safe create_task"""
+        return asyncio.run_coroutine_threadsafe(async_fn, self.__loop)
+
+    def close(self):
+        """stop watching the loop and close it"""
+        if self.__driver is not None:
+            self.__driver.close()
+            for name in ("call_soon", "call_at"):
+                vars(self.__loop).pop(name, None)
+        self.__loop.close()
+
+    def __notifying(self, method: typing.Callable[..., asyncio.Handle]):
+        # weak, a loop -> driver -> loop cycle would leave the driver's QObjects to the cyclic gc,
+        # which may run in any thread
+        driver_ref = weakref.ref(self.__driver)
+
+        def notify(*args, **kwargs):
+            handle = method(*args, **kwargs)
+            # inside a batch the driver reschedules once the batch ends
+            if (driver := driver_ref()) is not None and not driver.batching:
+                driver.schedule()
+            return handle
+
+        return notify
+
+    @property
+    def loop(self):
+        return self.__loop
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def monitor(self):
+        return self.__monitor
+
+
+class QtEventLoop(asyncio.SelectorEventLoop):
+    """
+    asyncio event loop running on the Qt event loop of the current thread\n
+    call_soon posts a QtAsyncioEvent, call_later arms a QTimer, add_reader/add_writer create QSocketNotifiers
+    and call_soon_threadsafe wakes the self-pipe's notifier, so there is no separate loop to stop and restart\n
+    run_forever (and so run_until_complete, asyncio.run with QtEventLoopPolicy) runs a QEventLoop,
+    inside it Qt slots see the loop from asyncio.get_running_loop(),
+    while the application runs app.exec_() instead, callbacks still run and see it as the running loop
+    """
+
+    def __init__(self,
+                 selector: typing.Optional[selectors.BaseSelector] = None,
+                 policy: typing.Optional[SchedulePolicy] = None,
+                 monitor: typing.Optional[LoopMonitor] = None):
+        self.__driver: typing.Optional[_QtLoopDriver] = None
+        self.__qt_loop: typing.Optional[QEventLoop] = None
+        self.__stop_requested = False
+        super().__init__(selector)
+        self.__driver = _QtLoopDriver(self, SchedulePolicy() if policy is None else policy,
+                                      self.__run_batch, lambda: None, monitor)
+        self.__driver.schedule()
+
+    @property
+    def policy(self):
+        return self.__driver.policy
+
+    @property
+    def monitor(self):
+        return self.__driver.monitor
+
+    def run_forever(self):
+        self._check_closed()
+        self._check_running()
+        if QCoreApplication.instance() is None:
+            raise RuntimeError("QtEventLoop.run_forever needs a QCoreApplication")
+        self._set_coroutine_origin_tracking(self._debug)
+        try:
+            with self.__running():
+                if self.__stop_requested:
+                    self.__driver.continue_loop()
+                    return
+                self.__qt_loop = QEventLoop()
+                self.__driver.wakeup()
+                self.__qt_loop.exec_()
+        finally:
+            self.__qt_loop = None
+            self.__stop_requested = False
+            self._set_coroutine_origin_tracking(False)
+
+    def stop(self):
+        if self.__qt_loop is not None:
+            self.__driver.end_batch()
+            self.__qt_loop.exit()  # returns once the running batch is done
+        else:
+            self.__stop_requested = True
+
+    def close(self):
+        if self.__driver is not None:
+            self.__driver.close()
+        super().close()
+
+    def call_soon(self, callback, *args, context=None):
+        handle = super().call_soon(callback, *args, context=context)
+        self.__notify()
+        return handle
+
+    def call_at(self, when, callback, *args, context=None):
+        handle = super().call_at(when, callback, *args, context=context)
+        self.__notify()
+        return handle
+
+    def _add_reader(self, fd, callback, *args):
+        handle = super()._add_reader(fd, callback, *args)
+        self.__notify()
+        return handle
+
+    def _add_writer(self, fd, callback, *args):
+        handle = super()._add_writer(fd, callback, *args)
+        self.__notify()
+        return handle
+
+    def __notify(self):
+        # inside a batch the driver reschedules once the batch ends
+        if self.__driver is not None and not self.__driver.batching:
+            self.__driver.schedule()
+
+    def __run_batch(self):
+        with self.__running():
+            while self.__driver.batching:
+                self._run_once()
+
+    @contextlib.contextmanager
+    def __running(self):
+        """the state BaseEventLoop.run_forever sets up, entered once per batch when Qt runs outside run_forever"""
+        if self.is_running():
+            yield
+            return
+        old_agen_hooks = sys.get_asyncgen_hooks()
+        self._thread_id = threading.get_ident()
+        sys.set_asyncgen_hooks(firstiter=self._asyncgen_firstiter_hook, finalizer=self._asyncgen_finalizer_hook)
+        asyncio._set_running_loop(self)  # noqa
         try:
-            return await async_fn
+            yield
         finally:
-            self.__sem -= 1
+            self._thread_id = None
+            asyncio._set_running_loop(None)  # noqa
+            sys.set_asyncgen_hooks(*old_agen_hooks)
+
+
+class QtEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """
+    example:
+        app = QApplication()
+        asyncio.set_event_loop_policy(QtEventLoopPolicy())
+        asyncio.run(main())
+    """
+
+    def __init__(self,
+                 policy: typing.Optional[SchedulePolicy] = None,
+                 monitor: typing.Optional[LoopMonitor] = None):
+        super().__init__()
+        self.__policy = policy
+        self.__monitor = monitor
+
+    def new_event_loop(self):
+        return QtEventLoop(policy=self.__policy, monitor=self.__monitor)
+
+
+class QtAsyncioThread(BridgeThread):
+    """
+    a QThread with its own asyncio loop driven by QtAsyncio, several of them spread io across threads
+
+    example:
+        with QtAsyncioThread() as worker:
+            result = await asyncio.wrap_future(worker.submit(download(url)))
+    """
+
+    def __init__(self,
+                 policy: typing.Optional[SchedulePolicy] = None,
+                 monitor: typing.Optional[LoopMonitor] = None,
+                 parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.__policy = policy
+        self.__monitor = monitor
+        self.__bridge: typing.Optional[QtAsyncio] = None
+
+    @property
+    def bridge(self):
+        return self.__bridge
 
     @property
     def loop(self):
-        return self.__loop
+        return None if self.__bridge is None else self.__bridge.loop
+
+    def submit(self, async_fn: typing.Coroutine) -> concurrent.futures.Future:
+        """thread safe, cancelling the future cancels the task"""
+        return self.__bridge.submit(async_fn)
+
+    def _serve(self):
+        loop = asyncio.new_event_loop()
+        # the bridge's QObjects must live in this thread
+        bridge = self.__bridge = QtAsyncio(loop, self.__policy, self.__monitor)
+        self._set_ready()
+        try:
+            self.exec_()
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            bridge.close()
+
+    def _stop(self):
+        self.quit()
+
+
+class AsyncioOffload(Offload):
+    """
+    example:
+        with AsyncioOffload(processes=True) as offload:
+            results = await offload.map(work, items, 64, progress_bar.setValue)
+    """
+
+    async def run(self, fn: typing.Callable, *args, **kwargs):
+        return await self.__wait(self.submit(fn, *args, **kwargs))
+
+    async def map(self,
+                  fn: typing.Callable,
+                  iterable: typing.Iterable,
+                  chunksize: int = 1,
+                  progress: typing.Optional[ProgressCallback] = None):
+        """
+        :return: 按输入顺序排列的结果列表
+        """
+        futures = self.submit_chunks(fn, iterable, chunksize, progress)
+        try:
+            chunks = await asyncio.gather(*(self.__wait(future) for future in futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return [result for chunk in chunks for result in chunk]
+
+    @staticmethod
+    async def __wait(future: concurrent.futures.Future):
+        # cancelling the wrapper cancels the executor future as well
+        return await asyncio.wrap_future(future)
+
+
+class AsyncioSignalStream(SignalStream):
+    """
+    example:
+        async with AsyncioSignalStream(slider.valueChanged, policy=StreamPolicy.COALESCE_LATEST) as values:
+            async for value in values:
+                await redraw(value)
+    """
+
+    def __init__(self,
+                 signal: SignalInstance,
+                 capacity: int = 64,
+                 policy: StreamPolicy = StreamPolicy.DROP_OLDEST,
+                 loop: typing.Optional[asyncio.AbstractEventLoop] = None):
+        """
+        :param loop: 消费者所在的 loop, None 为当前运行的 loop
+        """
+        self.__loop = asyncio.get_running_loop() if loop is None else loop
+        self.__waiter: typing.Optional[asyncio.Future] = None
+        super().__init__(signal, capacity, policy)
+
+    async def receive(self):
+        """
+        :raise SignalStreamClosed: 已关闭且缓冲区为空
+        """
+        while True:
+            received, value = self._pop()
+            if received:
+                return value
+            if self.closed:
+                raise SignalStreamClosed()
+            self.__waiter = self.__loop.create_future()
+            try:
+                await self.__waiter
+            finally:
+                self.__waiter = None
+
+    def _wakeup(self):
+        # also wakes a QtAsyncio driven loop, through its self-pipe notifier
+        self.__loop.call_soon_threadsafe(self.__wake)
+
+    def __wake(self):
+        if self.__waiter is not None and not self.__waiter.done():
+            self.__waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.receive()
+        except SignalStreamClosed:
+            raise StopAsyncIteration from None
 
-    def __continue_loop(self):
-        self.__loop.call_soon(self.__next_guest_run_schedule)
-        self.__loop.run_forever()
+    async def __aenter__(self):
+        return self
 
-    def __next_guest_run_schedule(self):
-        self.__loop.stop()
-        if self.__sem != 0:
-            QCoreApplication.postEvent(self.__async_object, QtAsyncioEvent(self.__continue_loop))
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 __all__ = [
+    "AsyncioOffload",
+    "AsyncioSignalStream",
     "QtAsyncio",
+    "QtAsyncioThread",
+    "QtEventLoop",
+    "QtEventLoopPolicy",
+    "SchedulePolicy",
 ]
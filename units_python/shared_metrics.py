@@ -0,0 +1,224 @@
+import multiprocessing.shared_memory
+import os
+import struct
+import threading
+import time
+import types
+import typing
+import warnings
+
+from .function_hook import Checkpoint, CheckpointScope, Hook, Sampler
+from .profiling import HISTOGRAM_BUCKETS, FunctionProfile, format_table
+
+_MAGIC = 0x756e6974_6d657472  # "unitmetr"
+_WORD = 8
+_HEADER_WORDS = 4  # magic, processes, functions, reserved
+_SLOT_WORDS = 2  # pid, functions used
+_NAME_BYTES = 128
+_NAME_WORDS = _NAME_BYTES // _WORD
+# name, calls, exceptions, total_ns, min_ns + 1 (0 before the first call), max_ns, buckets
+_CALLS, _EXCEPTIONS, _TOTAL, _MIN, _MAX, _BUCKETS = range(_NAME_WORDS, _NAME_WORDS + 6)
+_RECORD_WORDS = _BUCKETS + HISTOGRAM_BUCKETS
+
+
+class SharedMetricsCheckpoint(Checkpoint):
+    """per call checkpoint (CheckpointScope.CALL), writes into the record of its function in this process's slot"""
+
+    def __init__(self, words: memoryview, base: int):
+        self.__words = words
+        self.__base = base
+        self.__start = 0
+
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        self.__start = time.perf_counter_ns()
+
+    def exit(self, result: typing.Any):
+        self.__record(time.perf_counter_ns() - self.__start, False)
+
+    def exception(self, exc: BaseException):
+        self.__record(time.perf_counter_ns() - self.__start, True)
+
+    def __record(self, elapsed_ns: int, failed: bool):
+        words = self.__words
+        base = self.__base
+        words[base + _CALLS] += 1
+        words[base + _TOTAL] += elapsed_ns
+        if failed:
+            words[base + _EXCEPTIONS] += 1
+        minimum = words[base + _MIN]
+        if minimum == 0 or elapsed_ns < minimum - 1:
+            words[base + _MIN] = elapsed_ns + 1
+        if elapsed_ns > words[base + _MAX]:
+            words[base + _MAX] = elapsed_ns
+        bucket = elapsed_ns.bit_length()
+        words[base + _BUCKETS + (bucket if bucket < HISTOGRAM_BUCKETS else HISTOGRAM_BUCKETS - 1)] += 1
+
+
+class SharedMetrics:
+    """
+    per function latency statistics of many processes in one shared memory block\n
+    every process owns a slot and is its only writer, so updates take no lock,
+    threads of one process may very rarely lose an update (like FunctionProfile)\n
+    the supervisor creates the block, workers attach to a slot, snapshot merges all slots by function name\n
+    example:
+        metrics = SharedMetrics.create(processes=8)
+        counter = multiprocessing.Value("i", 0)
+        pool = ProcessPoolExecutor(8, initializer=worker_init, initargs=(metrics.name, counter))
+        # worker_init: SharedMetrics.attach(name, counter).install(hook)
+        print(metrics.table())
+    """
+
+    def __init__(self, shm: multiprocessing.shared_memory.SharedMemory, owner: bool, slot: typing.Optional[int]):
+        self.__shm = shm
+        self.__owner = owner
+        self.__words = shm.buf.cast("q")
+        magic, self.__processes, self.__functions, _ = self.__words[:_HEADER_WORDS]
+        if magic != _MAGIC:
+            self.__words.release()
+            raise ValueError(f"not a shared metrics block: {shm.name}")
+        self.__slot = slot
+        self.__records: typing.Dict[str, int] = {}  # function name -> record base in this process's slot
+        self.__lock = threading.Lock()
+        self.__full = False
+
+    @classmethod
+    def create(cls, processes: int = 16, functions: int = 256, name: typing.Optional[str] = None):
+        """
+        :param processes: 进程槽位数量
+        :param functions: 每个进程最多记录的函数数量
+        :param name: 共享内存名称, None 自动生成
+        """
+        if processes <= 0 or functions <= 0:
+            raise ValueError(f"shared metrics size must be positive: {processes}, {functions}")
+        size = (_HEADER_WORDS + processes * (_SLOT_WORDS + functions * _RECORD_WORDS)) * _WORD
+        shm = multiprocessing.shared_memory.SharedMemory(name, create=True, size=size)
+        struct.pack_into("4q", shm.buf, 0, _MAGIC, processes, functions, 0)
+        return cls(shm, True, None)
+
+    @classmethod
+    def attach(cls, name: str, slot: typing.Union[None, int, typing.Any] = None):
+        """
+        :param name: create 返回的对象的 name
+        :param slot: 本进程写入的槽位, 或 multiprocessing.Value("i") 计数器 (每次 attach 取下一个槽位),
+                     None 表示只读取
+        """
+        try:
+            shm = multiprocessing.shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # before python 3.13 attaching registers the block with the resource tracker too,
+            # workers share the tracker of the supervisor and only the creator's unlink removes it,
+            # an unrelated process attaching would have it unlinked when it exits
+            shm = multiprocessing.shared_memory.SharedMemory(name)
+        if slot is not None and not isinstance(slot, int):
+            counter = slot
+            with counter.get_lock():
+                slot = counter.value
+                counter.value += 1
+        metrics = cls(shm, False, slot)
+        if slot is not None:
+            if not 0 <= slot < metrics.processes:
+                metrics.close()
+                raise ValueError(f"slot out of range: {slot}, {metrics.processes} processes")
+            metrics.__words[metrics.__slot_base(slot)] = os.getpid()
+        return metrics
+
+    @property
+    def name(self):
+        return self.__shm.name
+
+    @property
+    def processes(self):
+        return self.__processes
+
+    @property
+    def functions(self):
+        return self.__functions
+
+    @property
+    def slot(self):
+        return self.__slot
+
+    def install(self, hook: Hook, sampler: typing.Optional[Sampler] = None):
+        hook.add_checkpoint(self.checkpoint, CheckpointScope.CALL, sampler)
+        return self
+
+    def checkpoint(self, fn: types.FunctionType):
+        """checkpoint factory for Hook.add_checkpoint(..., CheckpointScope.CALL)"""
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        if (base := self.__records.get(name)) is None and (base := self.record(name)) is None:
+            return None
+        return SharedMetricsCheckpoint(self.__words, base)
+
+    def record(self, name: str) -> typing.Optional[int]:
+        """
+        :return: name 在本进程槽位中的记录位置, 槽位已满时返回 None
+        """
+        if self.__slot is None:
+            raise RuntimeError("attach with a slot to record metrics")
+        with self.__lock:
+            if (base := self.__records.get(name)) is not None:
+                return base
+            slot_base = self.__slot_base(self.__slot)
+            used = self.__words[slot_base + 1]
+            if used == self.__functions:
+                if not self.__full:
+                    self.__full = True
+                    warnings.warn(f"shared metrics slot {self.__slot} is full, {name} is not recorded")
+                return None
+            base = slot_base + _SLOT_WORDS + used * _RECORD_WORDS
+            encoded = name.encode()[:_NAME_BYTES]
+            self.__shm.buf[base * _WORD:base * _WORD + _NAME_BYTES] = encoded.ljust(_NAME_BYTES, b"\0")
+            # publish the record only once its name is written
+            self.__words[slot_base + 1] = used + 1
+            self.__records[name] = base
+            return base
+
+    def snapshot(self):
+        """merge every slot, same format as Profiler.snapshot"""
+        profiles: typing.Dict[str, FunctionProfile] = {}
+        words = self.__words
+        buf = self.__shm.buf
+        for slot in range(self.__processes):
+            slot_base = self.__slot_base(slot)
+            for i in range(words[slot_base + 1]):
+                base = slot_base + _SLOT_WORDS + i * _RECORD_WORDS
+                name = bytes(buf[base * _WORD:base * _WORD + _NAME_BYTES]).rstrip(b"\0").decode(errors="replace")
+                if (profile := profiles.get(name)) is None:
+                    profile = profiles[name] = FunctionProfile(name)
+                if (calls := words[base + _CALLS]) == 0:
+                    continue
+                profile.calls += calls
+                profile.exceptions += words[base + _EXCEPTIONS]
+                profile.total_ns += words[base + _TOTAL]
+                if 0 < words[base + _MIN] <= profile.min_ns:
+                    profile.min_ns = words[base + _MIN] - 1
+                profile.max_ns = max(profile.max_ns, words[base + _MAX])
+                for b in range(HISTOGRAM_BUCKETS):
+                    profile.buckets[b] += words[base + _BUCKETS + b]
+        return [profile.snapshot() for profile in profiles.values() if profile.calls]
+
+    def pids(self):
+        """pid of every attached slot, 0 for free slots"""
+        return [self.__words[self.__slot_base(slot)] for slot in range(self.__processes)]
+
+    def table(self, sort: str = "total_ns", limit: typing.Optional[int] = None):
+        return format_table(self.snapshot(), sort, limit)
+
+    def close(self):
+        """checkpoints created by this object must not be called afterwards"""
+        self.__words.release()
+        self.__shm.close()
+
+    def unlink(self):
+        """only the creator removes the block"""
+        if self.__owner:
+            self.__shm.unlink()
+
+    def __slot_base(self, slot: int):
+        return _HEADER_WORDS + slot * (_SLOT_WORDS + self.__functions * _RECORD_WORDS)
+
+
+__all__ = [
+    "SharedMetricsCheckpoint",
+    "SharedMetrics",
+]
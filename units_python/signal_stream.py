@@ -0,0 +1,129 @@
+import collections
+import enum
+import threading
+import typing
+
+from PySide2.QtCore import Qt, SignalInstance
+
+
+class StreamPolicy(enum.Enum):
+    DROP_OLDEST = "drop_oldest"  # discard the oldest buffered value
+    COALESCE_LATEST = "coalesce_latest"  # keep only the latest value, the buffer holds one
+    BLOCK = "block"  # emitters in other threads wait for room, in the consumer thread the new value is dropped
+
+
+class SignalStreamClosed(Exception):
+    pass
+
+
+class SignalStream:
+    """
+    bounded buffer of a Qt signal's emissions, consumed by one task (AsyncioSignalStream, TrioSignalStream)\n
+    the slot runs in the emitting thread (Qt.DirectConnection), value is the single argument,
+    None without arguments, or the tuple of all arguments\n
+    the consumer thread is the thread creating the stream, BLOCK can't wait there without deadlocking its own consumer
+    """
+
+    def __init__(self,
+                 signal: SignalInstance,
+                 capacity: int = 64,
+                 policy: StreamPolicy = StreamPolicy.DROP_OLDEST):
+        """
+        :param signal: 要接收的 Qt 信号
+        :param capacity: 缓冲区容量, COALESCE_LATEST 时固定为 1
+        :param policy: 缓冲区满时的策略
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.__signal = signal
+        self.__capacity = 1 if policy is StreamPolicy.COALESCE_LATEST else capacity
+        self.__policy = policy
+        self.__buffer: typing.Deque[typing.Any] = collections.deque()
+        self.__condition = threading.Condition()
+        self.__consumer = threading.get_ident()
+        self.__closed = False
+        self.__received = 0
+        self.__dropped = 0
+        signal.connect(self.__emitted, Qt.DirectConnection)
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def pending(self):
+        return len(self.__buffer)
+
+    @property
+    def received(self):
+        return self.__received
+
+    @property
+    def dropped(self):
+        """values discarded or replaced because the buffer was full"""
+        return self.__dropped
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    def close(self):
+        """disconnect from the signal, buffered values can still be received"""
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__condition.notify_all()
+        try:
+            self.__signal.disconnect(self.__emitted)
+        except (RuntimeError, TypeError):
+            pass  # the sender was already destroyed
+        self._wakeup()
+
+    def _pop(self) -> typing.Tuple[bool, typing.Any]:
+        """
+        :return: (是否取到值, 值)
+        """
+        with self.__condition:
+            if len(self.__buffer) == 0:
+                return False, None
+            value = self.__buffer.popleft()
+            self.__condition.notify()
+        return True, value
+
+    def _wakeup(self):
+        """called from any thread after a value was buffered or the stream closed"""
+        raise NotImplementedError
+
+    def __emitted(self, *args):
+        value = args[0] if len(args) == 1 else (args or None)
+        buffer = self.__buffer
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__received += 1
+            if len(buffer) >= self.__capacity:
+                if self.__policy is not StreamPolicy.BLOCK:
+                    buffer.popleft()
+                    self.__dropped += 1
+                elif threading.get_ident() == self.__consumer:
+                    self.__dropped += 1
+                    return
+                else:
+                    while len(buffer) >= self.__capacity and not self.__closed:
+                        self.__condition.wait()
+                    if self.__closed:
+                        return
+            buffer.append(value)
+        self._wakeup()
+
+
+__all__ = [
+    "StreamPolicy",
+    "SignalStreamClosed",
+    "SignalStream",
+]
@@ -1,22 +1,188 @@
+import collections.abc
 import inspect
+import types
 import typing
+import weakref
 
 from .units import Parameter, ParameterKind, T
 
+_KINDS = (
+    ParameterKind.POSITIONAL_ONLY,
+    ParameterKind.POSITIONAL_OR_KEYWORD,
+    ParameterKind.VAR_POSITIONAL,
+    ParameterKind.KEYWORD_ONLY,
+    ParameterKind.VAR_KEYWORD,
+)
+
+
+_UNCHECKED = (typing.Any, object, Parameter.empty)
+_UNION_TYPES = (typing.Union, getattr(types, "UnionType", typing.Union))
+# PEP 484 numeric tower: int is accepted where float is expected, int and float where complex is
+_PROMOTIONS = {float: (float, int), complex: (complex, float, int)}
+
+
+class _CheckBuilder:
+    """
+    turn an annotation into an inline expression: isinstance against plain classes (one tuple for a union of them,
+    float and complex also take the narrower numbers), length and item checks for tuple[...], the origin class for other generics,
+    annotations it can't check (TypeVar, Literal, strings, non runtime protocols ...) make the whole expression None
+    """
+
+    def __init__(self, check_name: str, builtin_name: typing.Callable[[str], str], globals_: typing.Dict[str, typing.Any]):
+        self.__check_name = check_name
+        self.__builtin_name = builtin_name
+        self.__globals = globals_
+        self.__count = 0
+
+    def build(self, annotation: typing.Any, value: str, depth: int = 0) -> typing.Optional[str]:
+        if annotation in _UNCHECKED:
+            return None
+        if annotation is None or annotation is type(None):
+            return f"{value} is None"
+        origin = typing.get_origin(annotation)
+        if origin is typing.Annotated:
+            return self.build(typing.get_args(annotation)[0], value, depth)
+        if origin in _UNION_TYPES:
+            return self.__union(typing.get_args(annotation), value, depth)
+        if origin is tuple:
+            return self.__tuple(typing.get_args(annotation), value, depth)
+        if origin is collections.abc.Callable:
+            return f"{self.__builtin_name('callable')}({value})"
+        if origin is None:
+            return self.__isinstance(self.__plain(annotation), value)
+        return self.__isinstance(origin if isinstance(origin, type) else None, value)
+
+    @staticmethod
+    def __plain(annotation: typing.Any):
+        if not isinstance(annotation, type) or annotation is typing.Any:  # Any is a class since 3.11
+            return None
+        if getattr(annotation, "_is_protocol", False) and not getattr(annotation, "_is_runtime_protocol", False):
+            return None
+        return annotation
+
+    def __isinstance(self, cls: typing.Any, value: str):
+        if cls is None:
+            return None
+        if cls is object:
+            return "True"
+        return f"{self.__builtin_name('isinstance')}({value}, {self.__constant(_PROMOTIONS.get(cls, cls))})"
+
+    def __constant(self, value: typing.Any):
+        name = f"{self.__check_name}_{self.__count}"
+        self.__count += 1
+        self.__globals[name] = value
+        return name
+
+    def __union(self, args: typing.Sequence[typing.Any], value: str, depth: int):
+        plain = []
+        complex_checks = []
+        for arg in args:
+            if arg in _UNCHECKED:
+                return None  # one arm accepting anything accepts everything
+            elif arg is type(None):
+                plain.append(arg)
+            elif typing.get_origin(arg) is None and (cls := self.__plain(arg)) is not None:
+                plain.extend(c for c in _PROMOTIONS.get(cls, (cls,)) if c not in plain)
+            elif (check := self.build(arg, value, depth)) is None:
+                return None
+            else:
+                complex_checks.append(f"({check})")
+        checks = []
+        if plain:
+            checks.append(f"{self.__builtin_name('isinstance')}({value}, {self.__constant(tuple(plain))})")
+        return " or ".join(checks + complex_checks)
+
+    def __tuple(self, args: typing.Sequence[typing.Any], value: str, depth: int):
+        is_tuple = f"{self.__builtin_name('isinstance')}({value}, {self.__builtin_name('tuple')})"
+        if not args:
+            return is_tuple
+        if args == ((),):
+            return f"{is_tuple} and {self.__builtin_name('len')}({value}) == 0"
+        if len(args) == 2 and args[1] is Ellipsis:
+            item = f"{self.__builtin_name('item')}{depth}"
+            if (check := self.build(args[0], item, depth + 1)) is None:
+                return is_tuple
+            return f"{is_tuple} and {self.__builtin_name('all')}({check} for {item} in {value})"
+        checks = [is_tuple, f"{self.__builtin_name('len')}({value}) == {len(args)}"]
+        for i, arg in enumerate(args):
+            if (check := self.build(arg, f"{value}[{i}]", depth)) is not None:
+                checks.append(f"({check})")
+        return " and ".join(checks)
+
+
+class ParameterInfo:
+    """immutable copy of inspect.Parameter, plain slots are cheaper to read than Parameter's properties"""
+    __slots__ = ("name", "kind", "default", "annotation")
+    empty = Parameter.empty
+
+    def __init__(self, par: Parameter):
+        object.__setattr__(self, "name", par.name)
+        object.__setattr__(self, "kind", par.kind)
+        object.__setattr__(self, "default", par.default)
+        object.__setattr__(self, "annotation", par.annotation)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.kind.name} {self.name}>"
+
+
+class _SignatureModel:
+    """everything Signature needs from inspect.signature, computed in one pass"""
+    __slots__ = ("signature", "parameters", "groups", "shape")
+
+    def __init__(self, fn: typing.Callable):
+        self.signature = inspect.signature(fn)
+        self.parameters = tuple(ParameterInfo(par) for par in self.signature.parameters.values())
+        groups: typing.Dict[ParameterKind, typing.List[ParameterInfo]] = {kind: [] for kind in _KINDS}
+        for par in self.parameters:
+            groups[par.kind].append(par)
+        # same order as the result of Signature.traversal_parameters
+        self.groups = tuple(tuple(groups[kind]) for kind in _KINDS)
+        self.shape = tuple((par.name, par.kind, par.default is not par.empty) for par in self.parameters)
+
+
+_models: "weakref.WeakKeyDictionary[typing.Callable, _SignatureModel]" = weakref.WeakKeyDictionary()
+
 
 class Signature:
     def __init__(self, fn: typing.Callable):
-        self.__sigs = inspect.signature(fn)
-        self.__pars = self.__sigs.parameters
+        self.__model = self.__get_model(fn)
+        self.__sigs = self.__model.signature
+
+    @staticmethod
+    def __get_model(fn: typing.Callable):
+        """analysis is cached weakly per callable, callables that can't be weakly referenced are analysed every time"""
+        try:
+            return _models[fn]
+        except KeyError:
+            pass
+        except TypeError:
+            return _SignatureModel(fn)
+        model = _models[fn] = _SignatureModel(fn)
+        return model
 
     @property
     def signature(self):
         return self.__sigs
 
+    @property
+    def parameters(self) -> typing.Tuple[ParameterInfo, ...]:
+        return self.__model.parameters
+
+    @property
+    def shape(self) -> typing.Tuple[typing.Tuple[str, ParameterKind, bool], ...]:
+        """(name, kind, has default) of every parameter"""
+        return self.__model.shape
+
     @property
     def annotation(self):
         types_list = []
-        for par in self.__pars.values():
+        for par in self.__model.parameters:
             if par.annotation is par.empty:
                 types_list.append(object)
             else:
@@ -42,9 +208,24 @@ class Signature:
         :param actual_name: 自定义生成的实参命名
         :return: 参数调用数组
         """
-        po, pok, vp, ko, vk = self.__arguments_assign_signature(self.__pars, formal_name, actual_name)
+        po, pok, vp, ko, vk = self.__arguments_assign_signature(self.__model, formal_name, actual_name)
+        if len(vp) != 0:
+            # 存在 *args 时必须按位置传递, 否则会与 *args 展开的值冲突
+            pok = self.traversal_parameters(self.__model, lambda name, _: actual_name(name))[1]
         return po + pok + vp + ko + vk
 
+    def pack_statement(self, actual_name: typing.Callable[[str], str] = lambda name: name):
+        """
+        build the items packing the arguments like inspect.BoundArguments (after apply_defaults)\n
+        example: def demo(a, /, b, *c, d, **e)
+        return: (("a", "b", "*c"), ("'d': d", "**e"))
+        :param actual_name: 自定义生成的实参命名
+        :return: 位置参数元组的元素, 关键字参数字典的元素
+        """
+        po, pok, vp, ko, vk = self.traversal_parameters(
+            self.__model, lambda name, par: self.__argument_pack_signature(name, actual_name(name), par.kind))
+        return po + pok + vp, ko + vk
+
     def statement_with_type(self,
                             formal_name: typing.Callable[[str], str] = lambda name: name,
                             default_name: typing.Callable[[str], str] = lambda name: "_default_" + name,
@@ -60,25 +241,62 @@ class Signature:
         def build_name(name: str):
             return formal_name(name) + ": " + type_name(name)
 
-        def build_type(name: str, _: Parameter):
-            return type_name(name)
-
-        def get_type_annotation(_: str, par: Parameter):
-            if par.annotation is par.empty:
-                return typing.Any
-            return par.annotation
+        po, pok, vp, ko, vk = self.__arguments_signature(self.__model, build_name, default_name)
+        return (self.join_statement(po, pok, vp, ko, vk)), self.type_dict(type_name), self.default_dict(default_name)
 
-        po, pok, vp, ko, vk = self.__arguments_signature(self.__pars, build_name, default_name)
-        po_n, pok_n, vp_n, ko_n, vk_n = self.traversal_parameters(self.__pars, build_type)
-        po_t, pok_t, vp_t, ko_t, vk_t = self.traversal_parameters(self.__pars, get_type_annotation)
+    def type_dict(self, type_name: typing.Callable[[str], str] = lambda name: "_type_" + name):
+        """
+        :param type_name: 自定义生成的类型命名
+        :return: {类型命名: 类型注解}, 没有注解的参数为 typing.Any
+        """
         type_dict: typing.Dict[str, typing.Any] = {}
-        type_dict.update(zip(po_n, po_t))
-        type_dict.update(zip(pok_n, pok_t))
-        type_dict.update(zip(vp_n, vp_t))
-        type_dict.update(zip(ko_n, ko_t))
-        type_dict.update(zip(vk_n, vk_t))
-        default_dict = self.__arguments_default(self.__pars, default_name)
-        return (self.join_statement(po, pok, vp, ko, vk)), type_dict, default_dict
+        for par in self.__model.parameters:
+            type_dict[type_name(par.name)] = typing.Any if par.annotation is par.empty else par.annotation
+        return type_dict
+
+    def default_dict(self, default_name: typing.Callable[[str], str] = lambda name: "_default_" + name):
+        """
+        :param default_name: 自定义生成的默认参数命名
+        :return: {默认参数命名: 默认值}
+        """
+        return self.__arguments_default(self.__model, default_name)
+
+    def check_statement(self,
+                        annotations: typing.Optional[typing.Mapping[str, typing.Any]] = None,
+                        check_name: typing.Callable[[str], str] = lambda name: "_check_" + name,
+                        builtin_name: typing.Callable[[str], str] = lambda name: name,
+                        default_name: typing.Callable[[str], str] = lambda name: "_default_" + name):
+        """
+        build inline type checks of the arguments\n
+        example: def demo(a: int, *b: str, c: typing.Optional[float] = None)
+        return: (("a", "isinstance(a, _check_a_0)"), ("b", "all(isinstance(item0, _check_b_0) for item0 in b)"),
+                 ("c", "c is _default_c or isinstance(c, _check_c_0)")), {"_check_a_0": int, ...}
+        :param annotations: 参数名到注解的映射 (如 typing.get_type_hints 的结果), None 使用签名中的注解
+        :param check_name: 自定义生成的检查常量命名
+        :param builtin_name: 检查中使用的内置函数 (isinstance, len, all, callable, tuple) 及循环变量的命名
+        :param default_name: 与 statement 一致的默认参数命名
+        :return: ((参数名, 检查表达式), ...), {检查常量命名: 值}, 不能检查的参数不出现在结果中
+        """
+        globals_: typing.Dict[str, typing.Any] = {}
+        checks = []
+        for par in self.__model.parameters:
+            annotation = par.annotation if annotations is None else annotations.get(par.name, par.empty)
+            if isinstance(annotation, str):
+                continue
+            builder = _CheckBuilder(check_name(par.name), builtin_name, globals_)
+            if par.kind is ParameterKind.VAR_POSITIONAL or par.kind is ParameterKind.VAR_KEYWORD:
+                item = builtin_name("item") + "0"
+                if (check := builder.build(annotation, item, 1)) is None:
+                    continue
+                values = par.name if par.kind is ParameterKind.VAR_POSITIONAL else par.name + ".values()"
+                check = f"{builtin_name('all')}({check} for {item} in {values})"
+            elif (check := builder.build(annotation, par.name)) is None:
+                continue
+            if par.default is not par.empty:
+                # the default value passes, even when it doesn't match (x: int = None)
+                check = f"{par.name} is {default_name(par.name)} or {check}"
+            checks.append((par.name, check))
+        return tuple(checks), globals_
 
     def statement(self,
                   formal_name: typing.Callable[[str], str] = lambda name: name,
@@ -92,8 +310,8 @@ class Signature:
         :param default_name: 自定义生成的默认参数命名
         :return: 函数形参数组
         """
-        po, pok, vp, ko, vk = self.__arguments_signature(self.__pars, formal_name, default_name)
-        default_dict = self.__arguments_default(self.__pars, default_name)
+        po, pok, vp, ko, vk = self.__arguments_signature(self.__model, formal_name, default_name)
+        default_dict = self.__arguments_default(self.__model, default_name)
         return self.join_statement(po, pok, vp, ko, vk), default_dict
 
     @staticmethod
@@ -108,14 +326,14 @@ class Signature:
             args.append("/")
         args.extend(position_or_key)
         args.extend(var_position)
-        if len(key_only) != 0:
+        if len(key_only) != 0 and len(var_position) == 0:
             args.append("*")
         args.extend(key_only)
         args.extend(var_key)
         return tuple(args)
 
     @classmethod
-    def __arguments_default(cls, parameters: typing.Mapping[str, Parameter], default_name: typing.Callable[[str], str]):
+    def __arguments_default(cls, parameters: _SignatureModel, default_name: typing.Callable[[str], str]):
         def default_rename(n: str, par: Parameter):
             return default_name(n), par.default
 
@@ -129,7 +347,7 @@ class Signature:
         return default_dict
 
     @classmethod
-    def __arguments_assign_signature(cls, parameters: typing.Mapping[str, Parameter],
+    def __arguments_assign_signature(cls, parameters: _SignatureModel,
                                      formal_name: typing.Callable[[str], str],
                                      actual_name: typing.Callable[[str], str]):
         def argument_assign_signature(name: str, par: Parameter):
@@ -138,7 +356,7 @@ class Signature:
         return cls.traversal_parameters(parameters, argument_assign_signature)
 
     @classmethod
-    def __arguments_signature(cls, parameters: typing.Mapping[str, Parameter],
+    def __arguments_signature(cls, parameters: _SignatureModel,
                               formal_name: typing.Callable[[str], str],
                               default_name: typing.Callable[[str], str]):
         def argument_signature(name: str, par: Parameter):
@@ -149,8 +367,11 @@ class Signature:
         return cls.traversal_parameters(parameters, argument_signature)
 
     @staticmethod
-    def traversal_parameters(parameters: typing.Mapping[str, Parameter],
+    def traversal_parameters(parameters: typing.Union[typing.Mapping[str, Parameter], _SignatureModel],
                              fn: typing.Callable[[str, Parameter], T]):
+        if isinstance(parameters, _SignatureModel):
+            return tuple(tuple(fn(par.name, par) for par in group) for group in parameters.groups)
+
         positional_only = []
         positional_or_keyword = []
         var_positional = []
@@ -192,6 +413,21 @@ class Signature:
         else:
             raise TypeError(f"unknown parameter kind: {kind}")
 
+    @staticmethod
+    def __argument_pack_signature(formal_arg: str, actual_arg: str, kind: ParameterKind):
+        if kind is ParameterKind.POSITIONAL_ONLY:
+            return actual_arg
+        elif kind is ParameterKind.POSITIONAL_OR_KEYWORD:
+            return actual_arg
+        elif kind is ParameterKind.VAR_POSITIONAL:
+            return "*" + actual_arg
+        elif kind is ParameterKind.KEYWORD_ONLY:
+            return repr(formal_arg) + ": " + actual_arg
+        elif kind is ParameterKind.VAR_KEYWORD:
+            return "**" + actual_arg
+        else:
+            raise TypeError(f"unknown parameter kind: {kind}")
+
     @staticmethod
     def __argument_signature(name: str, kind: ParameterKind):
         if kind is kind.POSITIONAL_ONLY:
@@ -210,4 +446,5 @@ class Signature:
 
 __all__ = [
     "Signature",
+    "ParameterInfo",
 ]
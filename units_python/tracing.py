@@ -0,0 +1,227 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import types
+import typing
+
+from .function_hook import Checkpoint, CheckpointScope, Hook, Sampler
+
+# (name, start_ns, end_ns, track, span, parent span, failed)
+_RecordT = typing.Tuple[str, int, int, int, int, int, bool]
+_SpanT = typing.List[int]  # [span, track], the track changes when the span is moved
+
+
+class TraceCheckpoint(Checkpoint):
+    """
+    per call checkpoint (CheckpointScope.CALL), the open span lives in a ContextVar,
+    so threads, asyncio tasks and trio tasks each nest their own calls and new tasks start under the spawning call
+    """
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.__tracer = tracer
+        self.__name = name
+        self.__span: _SpanT = [0, 0]
+        self.__parent: typing.Optional[_SpanT] = None
+        self.__token: typing.Optional[contextvars.Token] = None
+        self.__start = 0
+
+    def enter(self, args: typing.Tuple[typing.Any], kwargs: typing.Mapping[str, typing.Any]):
+        self.__parent, self.__span, self.__token = self.__tracer.open_span()
+        self.__start = time.perf_counter_ns()
+
+    def exit(self, result: typing.Any):
+        self.__close(False)
+
+    def exception(self, exc: BaseException):
+        self.__close(True)
+
+    def __close(self, failed: bool):
+        end = time.perf_counter_ns()
+        self.__tracer.close_span(self.__parent, self.__span, self.__token)
+        parent = self.__parent
+        self.__tracer.record((self.__name, self.__start, end, self.__span[1], self.__span[0],
+                              0 if parent is None else parent[0], failed))
+
+
+class Tracer:
+    """
+    call tree tracing of hooked functions, written as Chrome trace event JSON (array format) that Perfetto loads\n
+    records go to a buffer allocated up front, a full buffer is flushed to the sink or, without one,
+    newer records are dropped\n
+    every track nests properly: a call continues its parent's track while the parent is the innermost open span there,
+    otherwise (a concurrent task) it opens the thread's track or a free task track,
+    so the number of tracks follows the peak concurrency\n
+    a task started by a call may continue its track and outlive it, when the call closes
+    the spans still open above it are moved to a new task track, the track is released once nothing is open on it\n
+    example:
+        with open("trace.json", "w") as fp:
+            tracer = Tracer(sink=fp).install(hook)
+            ...
+            tracer.close()
+    """
+
+    def __init__(self, capacity: int = 1 << 16, sink: typing.Optional[typing.TextIO] = None):
+        """
+        :param capacity: 缓冲区可保存的调用数量
+        :param sink: 缓冲区满及 flush 时写入的文件, None 表示只保存在内存中, 由 dump 输出
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.__capacity = capacity
+        self.__records: typing.List[typing.Optional[_RecordT]] = [None] * capacity
+        self.__size = 0
+        self.__dropped = 0
+        self.__sink = sink
+        self.__written = 0
+        self.__lock = threading.Lock()
+        self.__pid = os.getpid()
+        self.__origin_ns = time.perf_counter_ns()
+        self.__current: contextvars.ContextVar[typing.Optional[_SpanT]] = \
+            contextvars.ContextVar(f"units_python_span_{id(self)}", default=None)
+        self.__span_ids = itertools.count(1)
+        self.__track_ids = itertools.count(1)
+        self.__stacks: typing.Dict[int, typing.List[_SpanT]] = {}  # track -> open spans, innermost last
+        self.__free_tracks: typing.List[int] = []  # task tracks without open span, reused before creating new ones
+        self.__tracks_lock = threading.Lock()
+        self.__track_names: typing.Dict[int, str] = {}
+        self.__named_tracks: typing.Set[int] = set()
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def pending(self):
+        """records in the buffer"""
+        return self.__size
+
+    def install(self, hook: Hook, sampler: typing.Optional[Sampler] = None):
+        hook.add_checkpoint(self.checkpoint, CheckpointScope.CALL, sampler)
+        return self
+
+    def checkpoint(self, fn: types.FunctionType):
+        """checkpoint factory for Hook.add_checkpoint(..., CheckpointScope.CALL)"""
+        return TraceCheckpoint(self, fn.__qualname__)
+
+    def open_span(self) -> typing.Tuple[typing.Optional[_SpanT], _SpanT, contextvars.Token]:
+        parent = self.__current.get()
+        stacks = self.__stacks
+        with self.__tracks_lock:
+            if parent is not None and (stack := stacks.get(parent[1])) and stack[-1] is parent:
+                track = parent[1]
+            elif not stacks.get(thread := threading.get_ident()):
+                track = thread
+                if thread not in self.__track_names:
+                    self.__track_names[thread] = threading.current_thread().name
+            else:
+                # a concurrent task on a thread whose track is taken by another call tree
+                track = self.__free_tracks.pop() if self.__free_tracks else self.__new_track()
+            span = [next(self.__span_ids), track]
+            stacks.setdefault(track, []).append(span)
+        return parent, span, self.__current.set(span)
+
+    def close_span(self, parent: typing.Optional[_SpanT], span: _SpanT, token: contextvars.Token):
+        with self.__tracks_lock:
+            stack = self.__stacks[span[1]]
+            if stack[-1] is not span:
+                # tasks continued the track and outlive the span, a track of their own keeps both nested
+                # (not a reused one, it may hold records overlapping their past)
+                i = len(stack) - 1
+                while stack[i] is not span:
+                    i -= 1
+                moved = stack[i + 1:]
+                del stack[i + 1:]
+                track = self.__new_track()
+                for moved_span in moved:
+                    moved_span[1] = track
+                self.__stacks[track] = moved
+            stack.pop()
+            if not stack:
+                track = span[1]
+                del self.__stacks[track]
+                if track < 0:
+                    self.__free_tracks.append(track)
+        try:
+            self.__current.reset(token)
+        except ValueError:
+            # closed in another context (async generators finalized elsewhere), that context never saw the span
+            pass
+
+    def __new_track(self):
+        track = -next(self.__track_ids)
+        self.__track_names[track] = f"task track {-track}"
+        return track
+
+    def record(self, record: _RecordT):
+        with self.__lock:
+            if self.__size == self.__capacity:
+                if self.__sink is None:
+                    self.__dropped += 1
+                    return
+                self.__flush()
+            self.__records[self.__size] = record
+            self.__size += 1
+
+    def events(self) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        """trace events of the buffered records"""
+        with self.__lock:
+            records = self.__records[:self.__size]
+        return self.__events(records, set())
+
+    def dump(self, fp: typing.TextIO):
+        """write the buffered records as a complete trace"""
+        fp.write("[\n")
+        fp.write(",\n".join(json.dumps(event) for event in self.events()))
+        fp.write("\n]\n")
+
+    def flush(self):
+        """write the buffered records to the sink"""
+        with self.__lock:
+            self.__flush()
+        if self.__sink is not None:
+            self.__sink.flush()
+
+    def close(self):
+        """flush and terminate the JSON array of the sink"""
+        with self.__lock:
+            self.__flush()
+            if self.__sink is not None:
+                self.__sink.write("[\n]\n" if self.__written == 0 else "\n]\n")
+                self.__sink = None
+                self.__written = 0
+
+    def __flush(self):
+        if self.__sink is None or self.__size == 0:
+            return
+        sink = self.__sink
+        for event in self.__events(self.__records[:self.__size], self.__named_tracks):
+            sink.write(",\n" if self.__written else "[\n")
+            sink.write(json.dumps(event))
+            self.__written += 1
+        for i in range(self.__size):
+            self.__records[i] = None
+        self.__size = 0
+
+    def __events(self, records: typing.Sequence[_RecordT], named: typing.Set[int]):
+        pid = self.__pid
+        origin = self.__origin_ns
+        for name, start, end, track, span, parent, failed in records:
+            if track not in named:
+                named.add(track)
+                yield {"ph": "M", "name": "thread_name", "pid": pid, "tid": track,
+                       "args": {"name": self.__track_names.get(track, str(track))}}
+            event = {"ph": "X", "name": name, "pid": pid, "tid": track,
+                     "ts": (start - origin) / 1e3, "dur": (end - start) / 1e3,
+                     "args": {"span": span, "parent": parent}}
+            if failed:
+                event["args"]["error"] = True
+            yield event
+
+
+__all__ = [
+    "TraceCheckpoint",
+    "Tracer",
+]
@@ -1,10 +1,32 @@
+import collections
+import concurrent.futures
+import threading
+import time
 import traceback
 import typing
 
 import outcome
 import trio.lowlevel
-from PySide2.QtCore import QEvent, QObject
-from PySide2.QtWidgets import QApplication
+from PySide2.QtCore import QCoreApplication, QEvent, QEventLoop, QObject, QThread, SignalInstance
+
+from .bridge_thread import BridgeThread
+from .loop_monitor import LoopMonitor
+from .offload import Offload, ProgressCallback
+from .signal_stream import SignalStream, SignalStreamClosed, StreamPolicy
+
+
+class _StepInstrument(trio.abc.Instrument):
+    """time every trio task step, so a stall names the task that caused it"""
+
+    def __init__(self, monitor: LoopMonitor):
+        self.__monitor = monitor
+        self.__started_ns = 0
+
+    def before_task_step(self, task: trio.lowlevel.Task):
+        self.__started_ns = time.perf_counter_ns()
+
+    def after_task_step(self, task: trio.lowlevel.Task):
+        self.__monitor.record_step(time.perf_counter_ns() - self.__started_ns, task)
 
 
 class TrioQt:
@@ -26,32 +48,301 @@ class TrioQt:
                 return True
             return False
 
-    def __init__(self, app: QApplication):
+    def __init__(self, app: typing.Optional[QCoreApplication] = None, monitor: typing.Optional[LoopMonitor] = None):
+        """
+        :param app: QApplication, QGuiApplication or (headless) QCoreApplication,
+                    None uses the existing instance or creates a QCoreApplication
+        :param monitor: 记录事件排队延迟, 回调耗时以及 trio task step 耗时
+        """
+        if app is None:
+            app = QCoreApplication.instance() or QCoreApplication([])
         self.__trio_qt_object = self.TrioQtObject()
 
         self.__app = app
-        self.__app.setQuitOnLastWindowClosed(False)
+        # only gui applications quit on their own, QtWidgets/QtGui are never imported for a QCoreApplication
+        if (set_quit_on_last_window_closed := getattr(app, "setQuitOnLastWindowClosed", None)) is not None:
+            set_quit_on_last_window_closed(False)
+
+        # callbacks from trio, drained by at most one pending TrioQtEvent
+        self.__callbacks: typing.Deque[typing.Callable] = collections.deque()
+        self.__lock = threading.Lock()
+        self.__posted = False
+        self.__posted_ns = 0
+        self.__monitor = monitor
+        self.__qt_loop: typing.Optional[QEventLoop] = None
+        self.__max_pending = 0
+        self.__posted_events = 0
+        self.__drains = 0
+        self.__dispatched = 0
+        self.__max_drain = 0
+
+    @property
+    def monitor(self):
+        return self.__monitor
+
+    @property
+    def pending(self):
+        """callbacks waiting for the next drain"""
+        return len(self.__callbacks)
+
+    @property
+    def max_pending(self):
+        return self.__max_pending
+
+    @property
+    def posted_events(self):
+        return self.__posted_events
+
+    @property
+    def drains(self):
+        return self.__drains
+
+    @property
+    def dispatched(self):
+        """callbacks run so far, dispatched / drains is the mean drain size"""
+        return self.__dispatched
+
+    @property
+    def max_drain(self):
+        return self.__max_drain
 
     def run(self, entry: typing.Callable[[], typing.Awaitable]):
         trio.lowlevel.start_guest_run(
             entry,
             run_sync_soon_threadsafe=self.__next_loop,
             done_callback=self.__done_callback,
+            instruments=() if self.__monitor is None else (_StepInstrument(self.__monitor),),
         )
-        return self.__app.exec_()
+        if QThread.currentThread() == self.__app.thread():
+            return self.__app.exec_()
+        # a worker thread runs its own QEventLoop, the TrioQtObject lives in the thread that created this TrioQt
+        self.__qt_loop = QEventLoop()
+        try:
+            return self.__qt_loop.exec_()
+        finally:
+            self.__qt_loop = None
+
+    @property
+    def app(self):
+        return self.__app
 
     def __next_loop(self, next_loop: typing.Callable):
-        self.__app.postEvent(self.__trio_qt_object, self.TrioQtEvent(next_loop))
+        """run_sync_soon_threadsafe, called from any thread"""
+        callbacks = self.__callbacks
+        callbacks.append(next_loop)
+        if len(callbacks) > self.__max_pending:
+            self.__max_pending = len(callbacks)
+        with self.__lock:
+            if self.__posted:
+                return
+            self.__posted = True
+            self.__posted_ns = time.perf_counter_ns()
+            self.__posted_events += 1
+        self.__app.postEvent(self.__trio_qt_object, self.TrioQtEvent(self.__drain))
+
+    def __drain(self):
+        started_ns = time.perf_counter_ns()
+        with self.__lock:
+            self.__posted = False
+            posted_ns = self.__posted_ns
+        callbacks = self.__callbacks
+        # only what is queued now, callbacks queued while draining get the next event so Qt is never starved
+        count = len(callbacks)
+        for _ in range(count):
+            callbacks.popleft()()
+        if self.__monitor is not None:
+            self.__monitor.record_dispatch(started_ns - posted_ns, time.perf_counter_ns() - started_ns)
+        self.__drains += 1
+        self.__dispatched += count
+        if count > self.__max_drain:
+            self.__max_drain = count
 
     def __done_callback(self, oc: typing.Optional[outcome.Error]):
-        self.__app.quit()
+        if self.__qt_loop is not None:
+            self.__qt_loop.exit()
+        else:
+            self.__app.quit()
         if isinstance(oc, outcome.Error):
             error = oc.error
             traceback.print_exception(type(error), error, error.__traceback__)
 
 
+async def wait_future(future: concurrent.futures.Future):
+    """await a concurrent.futures.Future from trio, cancelling the waiting task cancels the future"""
+    token = trio.lowlevel.current_trio_token()
+    done = trio.Event()
+
+    def _done(_: concurrent.futures.Future):
+        try:
+            token.run_sync_soon(done.set)
+        except trio.RunFinishedError:
+            pass
+
+    future.add_done_callback(_done)
+    try:
+        await done.wait()
+    except trio.Cancelled:
+        future.cancel()
+        raise
+    return future.result()
+
+
+class TrioQtThread(BridgeThread):
+    """
+    a QThread running its own trio loop through TrioQt\n
+    example:
+        with TrioQtThread() as worker:
+            result = await wait_future(worker.submit(download, url))
+    """
+
+    def __init__(self, monitor: typing.Optional[LoopMonitor] = None, parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.__monitor = monitor
+        self.__token: typing.Optional[trio.lowlevel.TrioToken] = None
+        self.__nursery: typing.Optional[trio.Nursery] = None
+
+    def submit(self, async_fn: typing.Callable[..., typing.Awaitable], *args) -> concurrent.futures.Future:
+        """
+        thread safe, the future can only be cancelled before the task starts\n
+        :raise trio.RunFinishedError: 线程已结束
+        """
+        future = concurrent.futures.Future()
+        self.__token.run_sync_soon(self.__start, future, async_fn, args)
+        return future
+
+    def _serve(self):
+        # the TrioQtObject must live in this thread
+        TrioQt(QCoreApplication.instance(), self.__monitor).run(self.__main)
+
+    def _stop(self):
+        try:
+            self.__token.run_sync_soon(self.__nursery.cancel_scope.cancel)
+        except trio.RunFinishedError:
+            pass
+
+    async def __main(self):
+        async with trio.open_nursery() as nursery:
+            self.__token = trio.lowlevel.current_trio_token()
+            self.__nursery = nursery
+            self._set_ready()
+            await trio.sleep_forever()
+
+    def __start(self, future: concurrent.futures.Future, async_fn: typing.Callable, args: tuple):
+        if future.set_running_or_notify_cancel():
+            self.__nursery.start_soon(self.__run, future, async_fn, args)
+
+    @staticmethod
+    async def __run(future: concurrent.futures.Future, async_fn: typing.Callable, args: tuple):
+        try:
+            result = await async_fn(*args)
+        except trio.Cancelled:
+            future.set_exception(concurrent.futures.CancelledError())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+
+class TrioOffload(Offload):
+    """
+    example:
+        with TrioOffload(processes=True) as offload:
+            results = await offload.map(work, items, 64, progress_bar.setValue)
+    """
+
+    async def run(self, fn: typing.Callable, *args, **kwargs):
+        return await wait_future(self.submit(fn, *args, **kwargs))
+
+    async def map(self,
+                  fn: typing.Callable,
+                  iterable: typing.Iterable,
+                  chunksize: int = 1,
+                  progress: typing.Optional[ProgressCallback] = None):
+        """
+        :return: 按输入顺序排列的结果列表
+        """
+        futures = self.submit_chunks(fn, iterable, chunksize, progress)
+        results = []
+        try:
+            for future in futures:
+                results.extend(await wait_future(future))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return results
+
+
+class TrioSignalStream(SignalStream):
+    """
+    replaces spawning a task per emission, e.g. clicked.connect(lambda: nursery.start_soon(...))
+
+    example:
+        async with TrioSignalStream(button.clicked, 1, StreamPolicy.COALESCE_LATEST) as clicks:
+            async for _ in clicks:
+                await on_click()
+    """
+
+    def __init__(self,
+                 signal: SignalInstance,
+                 capacity: int = 64,
+                 policy: StreamPolicy = StreamPolicy.DROP_OLDEST):
+        self.__token = trio.lowlevel.current_trio_token()
+        self.__event: typing.Optional[trio.Event] = None
+        super().__init__(signal, capacity, policy)
+
+    async def receive(self):
+        """
+        :raise SignalStreamClosed: 已关闭且缓冲区为空
+        """
+        await trio.lowlevel.checkpoint_if_cancelled()
+        while True:
+            received, value = self._pop()
+            if received:
+                # like trio's memory channels, a value taken from the buffer is never lost to a cancellation
+                await trio.lowlevel.cancel_shielded_checkpoint()
+                return value
+            if self.closed:
+                raise SignalStreamClosed()
+            self.__event = trio.Event()
+            try:
+                await self.__event.wait()
+            finally:
+                self.__event = None
+
+    def _wakeup(self):
+        try:
+            self.__token.run_sync_soon(self.__wake)
+        except trio.RunFinishedError:
+            pass
+
+    def __wake(self):
+        if self.__event is not None:
+            self.__event.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.receive()
+        except SignalStreamClosed:
+            raise StopAsyncIteration from None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 _FnType = typing.Callable[[trio.Nursery], typing.Any]
 
 __all__ = [
+    "TrioOffload",
     "TrioQt",
+    "TrioQtThread",
+    "TrioSignalStream",
+    "wait_future",
 ]